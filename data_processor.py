@@ -13,6 +13,23 @@ import warnings
 warnings.filterwarnings('ignore')
 import os
 
+# 风险等级从低到高的顺序
+RISK_LEVEL_ORDER = ['低', '中低', '中', '中高', '高', '未知']
+
+# 保险类型/产品特色关键词对应的位，用于按位快速判断是否包含关键词
+KEYWORD_BITS = {
+    '养老': 1,
+    '年金': 2,
+    '分红': 4,
+    '万能': 8,
+    '保证': 16,
+    '保本': 32,
+    '医疗': 64,
+    '健康': 128,
+    '补充': 256,
+    '附加': 512
+}
+
 
 class PensionProductAnalyzer:
     """个人养老金产品分析器"""
@@ -28,6 +45,8 @@ class PensionProductAnalyzer:
         self.processed_df = None
         self.products_by_id = {}
         self.products_by_company = {}
+        # (processed_df, (type_bits, feature_bits))，关键词位图不写入processed_df
+        self._keyword_bits_cache = (None, None)
 
         # 如果没有提供路径，尝试自动查找
         if excel_path is None:
@@ -605,7 +624,11 @@ class PensionProductAnalyzer:
 
         processed_data = []
 
-        for idx, row in self.df.iterrows():
+        # 用普通元组逐行遍历，避免iterrows为每行构造Series（列名不是合法标识符，不用命名元组）
+        columns = list(self.df.columns)
+
+        for idx, values in zip(self.df.index, self.df.itertuples(index=False, name=None)):
+            row = dict(zip(columns, values))
             try:
                 # 提取年龄范围
                 min_age, max_age = self.extract_age_range(row.get('适合年龄(BXLC)', ''))
@@ -665,6 +688,9 @@ class PensionProductAnalyzer:
                 continue
 
         self.processed_df = pd.DataFrame(processed_data)
+        self._normalize_feature_keywords(self.processed_df)
+        self.get_keyword_bits()
+        self._categorize_columns(self.processed_df)
 
         # 建立索引
         self._build_indexes()
@@ -672,6 +698,74 @@ class PensionProductAnalyzer:
         print(f"数据处理完成，有效记录: {len(self.processed_df)} 条")
         return self.processed_df
 
+    def compute_keyword_bits(self, df: pd.DataFrame) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        计算每个产品的关键词位图
+        Args:
+            df: 包含insurance_type和feature_keywords列的产品数据
+
+        Returns:
+            (type_bits, feature_bits): 保险类型包含的关键词位、特色关键词列表包含的关键词位
+        """
+        n = 0 if df is None else len(df)
+        type_bits = np.zeros(n, dtype=np.uint16)
+        feature_bits = np.zeros(n, dtype=np.uint16)
+        if n == 0:
+            return type_bits, feature_bits
+
+        insurance_type = df['insurance_type'].astype(object).fillna('').astype(str)
+        for keyword, bit in KEYWORD_BITS.items():
+            type_bits[insurance_type.str.contains(keyword, regex=False).to_numpy(dtype=bool)] |= bit
+
+        if 'feature_keywords' in df.columns:
+            # 所有关键词展平为一列，按关键词查位后一次归并回所属产品，不再逐产品逐关键词判断
+            features = [f if isinstance(f, (list, tuple, set)) else
+                        [k for k in KEYWORD_BITS if k in f] if isinstance(f, str) else ()
+                        for f in df['feature_keywords']]
+            lengths = np.fromiter((len(f) for f in features), dtype=np.intp, count=n)
+            flat = pd.Series([keyword for f in features for keyword in f], dtype=object)
+            bits = flat.map(KEYWORD_BITS).fillna(0).to_numpy(dtype=np.uint16)
+            np.bitwise_or.at(feature_bits, np.repeat(np.arange(n), lengths), bits)
+
+        return type_bits, feature_bits
+
+    def get_keyword_bits(self) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        获取processed_df的关键词位图，processed_df未变化时复用上次结果
+        位图单独保存，不出现在产品详情和导出数据中
+
+        Returns:
+            (type_bits, feature_bits): 数组顺序与processed_df行顺序一致
+        """
+        df = self.processed_df
+        if self._keyword_bits_cache[0] is not df:
+            self._keyword_bits_cache = (df, self.compute_keyword_bits(df))
+        return self._keyword_bits_cache[1]
+
+    def _normalize_feature_keywords(self, df: pd.DataFrame):
+        """将feature_keywords列统一为列表，缺失值替换为空列表，使用时不必再处理缺省值"""
+        if 'feature_keywords' not in df.columns:
+            df['feature_keywords'] = [[] for _ in range(len(df))]
+            return
+        df['feature_keywords'] = pd.Series(
+            [list(f) if isinstance(f, (list, tuple)) else [] for f in df['feature_keywords']],
+            index=df.index, dtype=object)
+
+    def _categorize_columns(self, df: pd.DataFrame):
+        """将取值有限的文本列转换为分类类型，减少内存并加快等值比较"""
+        for col in ('insurance_type', 'payment_type'):
+            if col in df.columns:
+                df[col] = df[col].astype('category')
+
+        if 'risk_level' not in df.columns:
+            return
+
+        # 风险等级按从低到高排列，只保留实际出现的等级
+        present = set(df['risk_level'].dropna())
+        categories = [level for level in RISK_LEVEL_ORDER if level in present]
+        categories += sorted(present - set(RISK_LEVEL_ORDER))
+        df['risk_level'] = pd.Categorical(df['risk_level'], categories=categories)
+
     def _format_coverage_str(self, coverage_info: Dict) -> str:
         """格式化保障期限字符串"""
         if coverage_info['type'] == '终身':
@@ -688,18 +782,17 @@ class PensionProductAnalyzer:
         if self.processed_df is None:
             return
 
+        # 一次性转换为记录列表
+        records = self.processed_df.to_dict('records')
+
         # 按产品ID索引
-        self.products_by_id = {}
-        for _, row in self.processed_df.iterrows():
-            self.products_by_id[row['product_id']] = row.to_dict()
+        self.products_by_id = {record['product_id']: record for record in records}
 
         # 按保险公司索引
         self.products_by_company = {}
-        for _, row in self.processed_df.iterrows():
-            company = row['insurance_company']
-            if company not in self.products_by_company:
-                self.products_by_company[company] = []
-            self.products_by_company[company].append(row.to_dict())
+        for record in records:
+            # 存放副本，修改get_product_details返回的字典不会影响公司索引
+            self.products_by_company.setdefault(record['insurance_company'], []).append(dict(record))
 
         print(f"已建立索引: {len(self.products_by_id)} 个产品, {len(self.products_by_company)} 家保险公司")
 
@@ -755,6 +848,9 @@ class PensionProductAnalyzer:
         if os.path.exists(filepath):
             try:
                 self.processed_df = pd.read_json(filepath, orient='records')
+                self._normalize_feature_keywords(self.processed_df)
+                self.get_keyword_bits()
+                self._categorize_columns(self.processed_df)
                 self._build_indexes()
                 print(f"从 {filepath} 加载处理后的数据成功")
                 return True
@@ -6,17 +6,69 @@ gui_interface.py - 养老金产品搜索与决策工具界面
 import tkinter as tk
 from tkinter import ttk, messagebox, scrolledtext, filedialog, simpledialog
 import pandas as pd
+import numpy as np
 from datetime import datetime
-import matplotlib.pyplot as plt
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
-from matplotlib.figure import Figure
-import matplotlib
-
-matplotlib.use('TkAgg')
 import os
 import webbrowser
-from PIL import Image, ImageTk
 import io
+import csv
+import json
+import types
+import itertools
+
+try:
+    import xlsxwriter  # noqa: F401
+    XLSX_ENGINE = 'xlsxwriter'
+except ImportError:
+    XLSX_ENGINE = None
+
+# 对比报告中单个产品的信息模板
+REPORT_PRODUCT_TEMPLATE = ("产品{i}: {product_name}\n"
+                           "  保险公司: {insurance_company}\n"
+                           "  适合年龄: {age_range_str}\n"
+                           "  风险等级: {risk_level}\n"
+                           "  最低保费: {min_premium_str}\n\n")
+
+
+def _write_xlsx(df, path):
+    """
+    导出DataFrame为xlsx文件
+    优先使用xlsxwriter的constant_memory模式逐行写盘，未安装时回退到pandas默认引擎(openpyxl)
+    """
+    if XLSX_ENGINE == 'xlsxwriter':
+        df.to_excel(path, index=False, engine='xlsxwriter',
+                    engine_kwargs={'options': {'constant_memory': True}})
+    else:
+        df.to_excel(path, index=False)
+
+
+def _write_csv(df, path):
+    """导出DataFrame为csv文件，使用大缓冲区分块写入"""
+    with open(path, 'w', encoding='utf-8-sig', newline='', buffering=1 << 20) as f:
+        df.to_csv(f, index=False, chunksize=4096)
+
+
+def _bulk_insert(tree, rows, batch=500):
+    """
+    分批向Treeview插入行，首批同步插入，其余在空闲时继续，避免阻塞界面
+    Args:
+        tree: ttk.Treeview
+        rows: tree.insert关键字参数字典的可迭代对象，如{'values': (...), 'tags': (...)}，
+              可以是生成器，按批取用
+        batch: 每批插入的行数
+    """
+    rows = iter(rows)
+
+    def step():
+        if not tree.winfo_exists():
+            return  # 窗口已关闭
+        chunk = list(itertools.islice(rows, batch))
+        for row in chunk:
+            tree.insert('', 'end', **row)
+        if len(chunk) == batch:
+            tree.after_idle(step)
+
+    step()
 
 
 class PensionProductApp:
@@ -30,15 +82,19 @@ class PensionProductApp:
             analyzer: PensionProductAnalyzer实例
             recommender: PensionProductRecommender实例
         """
-        # 设置matplotlib中文字体
-        matplotlib.rcParams['font.sans-serif'] = ['SimHei', 'DejaVu Sans']
-        matplotlib.rcParams['axes.unicode_minus'] = False
         self.root = root
         self.analyzer = analyzer
         self.recommender = recommender
         self.current_user_id = "user_001"
         self.selected_products = []  # 用于对比的产品ID列表
         self.current_recommendations = []  # 当前推荐结果
+        self._sim_arrays = None  # 查找类似产品用的列数组缓存
+        self._sim_arrays_df = None  # 生成缓存时对应的processed_df
+        self._cmp_cache_key = None  # 对比表缓存对应的(产品ID元组, processed_df)
+        self._cmp_cache = None  # 对比表缓存
+        self._summary_cache = None  # (processed_df, 统计摘要)
+        self._mpl = None  # matplotlib相关模块，首次生成图表时导入
+        self._pyperclip = None  # pyperclip模块，首次复制到剪贴板时导入
 
         # 设置窗口
         self.root.title("个人养老金产品搜索与决策工具")
@@ -59,6 +115,35 @@ class PensionProductApp:
         # 加载用户历史（如果有）
         self.load_user_history()
 
+    def _ensure_mpl(self):
+        """按需导入matplotlib（只有打开统计图表时才需要）"""
+        if self._mpl is None:
+            import matplotlib
+            matplotlib.use('TkAgg')
+            # 设置matplotlib中文字体
+            matplotlib.rcParams['font.sans-serif'] = ['SimHei', 'DejaVu Sans']
+            matplotlib.rcParams['axes.unicode_minus'] = False
+            from matplotlib.figure import Figure
+            from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+            self._mpl = types.SimpleNamespace(Figure=Figure, FigureCanvasTkAgg=FigureCanvasTkAgg)
+        return self._mpl
+
+    def _ensure_pyperclip(self):
+        """按需导入pyperclip，未安装时抛出ImportError"""
+        if self._pyperclip is None:
+            import pyperclip
+            self._pyperclip = pyperclip
+        return self._pyperclip
+
+    def copy_to_clipboard(self, text):
+        """复制文本到剪贴板，优先使用Tk自带剪贴板，失败时再用pyperclip"""
+        try:
+            self.root.clipboard_clear()
+            self.root.clipboard_append(text)
+            self.root.update()
+        except tk.TclError:
+            self._ensure_pyperclip().copy(text)
+
     def setup_styles(self):
         """设置界面样式"""
         style = ttk.Style()
@@ -715,6 +800,18 @@ class PensionProductApp:
                                      command=self.generate_analysis_charts, width=10)
         generate_button.pack(side=tk.LEFT, padx=(0, 20))
 
+        # 保存分辨率选择
+        ttk.Label(control_frame, text="保存DPI:", style='Normal.TLabel').pack(side=tk.LEFT, padx=(0, 5))
+        self.save_dpi_var = tk.IntVar(value=150)
+        dpi_combo = ttk.Combobox(control_frame, textvariable=self.save_dpi_var,
+                                 values=[96, 150, 300], width=6, state="readonly")
+        dpi_combo.pack(side=tk.LEFT, padx=(0, 10))
+
+        # 是否裁剪空白边距（需要额外一次布局计算）
+        self.save_tight_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(control_frame, text="裁剪边距",
+                        variable=self.save_tight_var).pack(side=tk.LEFT, padx=(0, 20))
+
         # 保存图表按钮
         save_button = ttk.Button(control_frame, text="保存图表",
                                  command=self.save_chart, width=10)
@@ -731,6 +828,14 @@ class PensionProductApp:
         # 创建画布框架
         self.chart_canvas_frame = ttk.Frame(chart_frame)
         self.chart_canvas_frame.grid(row=0, column=0, sticky=(tk.W, tk.E, tk.N, tk.S))
+        self.chart_canvas_frame.columnconfigure(0, weight=1)
+        self.chart_canvas_frame.rowconfigure(0, weight=1)
+
+        # 图表画布在首次生成图表时创建，之后切换图表时复用
+        self._fig = None
+        self._ax = None
+        self._canvas = None
+        self.current_figure = None
 
         # 统计摘要区域
         summary_frame = ttk.LabelFrame(main_frame, text="数据统计摘要", padding="10")
@@ -822,25 +927,8 @@ class PensionProductApp:
             # 保存当前推荐结果
             self.current_recommendations = result["recommendations"]
 
-            # 清空现有数据
-            for item in self.recommendation_tree.get_children():
-                self.recommendation_tree.delete(item)
-
             # 显示推荐结果
-            for rec in self.current_recommendations:
-                self.recommendation_tree.insert('', 'end',
-                                                values=(
-                                                    rec['product_name'],
-                                                    rec['insurance_company'],
-                                                    f"{rec['match_score']}%",
-                                                    rec['age_range'],
-                                                    rec['insurance_type'],
-                                                    rec['payment_type'],
-                                                    rec['min_premium'],
-                                                    rec['risk_level']
-                                                ),
-                                                tags=(rec['product_id'],)
-                                                )
+            self.populate_recommendation_tree(self.current_recommendations)
 
             # 更新状态
             self.status_var.set(f"找到 {len(self.current_recommendations)} 个推荐产品")
@@ -880,28 +968,25 @@ class PensionProductApp:
             else:
                 sorted_recommendations = self.current_recommendations
 
-            # 清空现有数据
-            for item in self.recommendation_tree.get_children():
-                self.recommendation_tree.delete(item)
-
             # 显示排序后的结果
-            for rec in sorted_recommendations:
-                self.recommendation_tree.insert('', 'end',
-                                                values=(
-                                                    rec['product_name'],
-                                                    rec['insurance_company'],
-                                                    f"{rec['match_score']}%",
-                                                    rec['age_range'],
-                                                    rec['insurance_type'],
-                                                    rec['payment_type'],
-                                                    rec['min_premium'],
-                                                    rec['risk_level']
-                                                ),
-                                                tags=(rec['product_id'],)
-                                                )
+            self.populate_recommendation_tree(sorted_recommendations)
 
             self.status_var.set(f"已按{sort_by}重新排序")
 
+    def populate_recommendation_tree(self, recommendations):
+        """填充推荐结果表格（批量插入期间暂时移出布局，避免逐行重绘）"""
+        tree = self.recommendation_tree
+        tree.grid_remove()
+        try:
+            tree.delete(*tree.get_children())
+            for rec in recommendations:
+                values = (rec['product_name'], rec['insurance_company'], f"{rec['match_score']}%",
+                          rec['age_range'], rec['insurance_type'], rec['payment_type'],
+                          rec['min_premium'], rec['risk_level'])
+                tree.insert('', 'end', values=values, tags=(rec['product_id'],))
+        finally:
+            tree.grid()
+
     def on_recommendation_select(self, event):
         """处理推荐产品选择事件"""
         selection = self.recommendation_tree.selection()
@@ -1374,7 +1459,6 @@ class PensionProductApp:
         messagebox.showinfo("提示", "打印功能需要连接打印机。建议已复制到剪贴板。")
 
         # 复制到剪贴板
-        import pyperclip
         try:
             advice_text = "个性化养老规划建议\n\n"
             advice_text += f"生成时间: {advice['advice_time']}\n\n"
@@ -1387,7 +1471,7 @@ class PensionProductApp:
             for item in advice['product_type_recommendations']:
                 advice_text += f"• {item}\n"
 
-            pyperclip.copy(advice_text)
+            self.copy_to_clipboard(advice_text)
             messagebox.showinfo("成功", "建议已复制到剪贴板")
         except:
             messagebox.showwarning("提示", "无法复制到剪贴板，请手动复制")
@@ -1427,17 +1511,26 @@ class PensionProductApp:
                 df = pd.DataFrame(export_data)
 
                 # 根据文件类型保存
-                if filename.endswith('.csv'):
-                    df.to_csv(filename, index=False, encoding='utf-8-sig')
-                elif filename.endswith('.xlsx'):
-                    df.to_excel(filename, index=False)
+                if filename.endswith('.xlsx'):
+                    _write_xlsx(df, filename)
                 else:
-                    df.to_csv(filename, index=False, encoding='utf-8-sig')
+                    _write_csv(df, filename)
 
                 messagebox.showinfo("成功", f"推荐结果已导出到: {filename}")
             except Exception as e:
                 messagebox.showerror("错误", f"导出推荐结果时出错: {str(e)}")
 
+    def get_comparison_table(self):
+        """获取当前对比产品的对比表，对比列表未变化时复用上次结果"""
+        product_ids = tuple(self.selected_products)
+        df = self.analyzer.processed_df
+        # 按对象身份比较processed_df，id()在旧数据释放后可能被新数据复用
+        if (self._cmp_cache_key is None or self._cmp_cache_key[0] != product_ids
+                or self._cmp_cache_key[1] is not df):
+            self._cmp_cache = self.recommender.generate_comparison_table(list(product_ids))
+            self._cmp_cache_key = (product_ids, df)
+        return self._cmp_cache
+
     def generate_comparison_report(self):
         """生成对比报告"""
         if not self.selected_products:
@@ -1445,7 +1538,7 @@ class PensionProductApp:
             return
 
         # 生成对比数据
-        comparison = self.recommender.generate_comparison_table(self.selected_products)
+        comparison = self.get_comparison_table()
 
         if not comparison:
             messagebox.showerror("错误", "无法生成对比报告")
@@ -1470,7 +1563,8 @@ class PensionProductApp:
         ttk.Label(info_frame, text=info_text, font=('微软雅黑', 10)).pack()
 
         # 创建Treeview显示对比
-        columns = ['feature'] + [f'product_{i + 1}' for i in range(len(self.selected_products))]
+        product_keys = [f'product_{i + 1}' for i in range(len(self.selected_products))]
+        columns = ['feature'] + product_keys
 
         report_tree = ttk.Treeview(report_window, columns=columns, show='headings', height=20)
 
@@ -1489,10 +1583,10 @@ class PensionProductApp:
             report_tree.column(f'product_{i + 1}', width=250)
 
         # 添加数据
-        for row in comparison:
-            report_tree.insert('', 'end', values=[row['feature']] +
-                                                 [row.get(f'product_{i + 1}', 'N/A') for i in
-                                                  range(len(self.selected_products))])
+        _bulk_insert(report_tree, (
+            {'values': (row['feature'],) + tuple(row.get(key, 'N/A') for key in product_keys)}
+            for row in comparison
+        ))
 
         # 添加滚动条
         scrollbar = ttk.Scrollbar(report_window, orient=tk.VERTICAL, command=report_tree.yview)
@@ -1530,25 +1624,23 @@ class PensionProductApp:
                     f.write(f"对比产品数: {len(self.selected_products)}\n\n")
 
                     # 写入产品信息
+                    parts = []
                     for i, product_id in enumerate(self.selected_products, 1):
                         product = self.analyzer.get_product_details(product_id)
                         if product:
-                            f.write(f"产品{i}: {product['product_name']}\n")
-                            f.write(f"  保险公司: {product['insurance_company']}\n")
-                            f.write(f"  适合年龄: {product['age_range_str']}\n")
-                            f.write(f"  风险等级: {product['risk_level']}\n")
-                            f.write(f"  最低保费: {product['min_premium_str']}\n\n")
+                            parts.append(REPORT_PRODUCT_TEMPLATE.format_map(dict(product, i=i)))
+                    f.write(''.join(parts))
 
                     f.write("\n" + "=" * 60 + "\n")
                     f.write("详细对比\n")
                     f.write("=" * 60 + "\n\n")
 
                     # 写入对比表格
+                    product_keys = [f'product_{i + 1}' for i in range(len(self.selected_products))]
                     for row in comparison:
                         f.write(f"{row['feature']}:\n")
-                        for i in range(len(self.selected_products)):
-                            col_name = f'product_{i + 1}'
-                            f.write(f"  产品{i + 1}: {row.get(col_name, 'N/A')}\n")
+                        for i, key in enumerate(product_keys, 1):
+                            f.write(f"  产品{i}: {row.get(key, 'N/A')}\n")
                         f.write("\n")
 
                 messagebox.showinfo("成功", f"对比报告已保存到: {filename}")
@@ -1560,20 +1652,20 @@ class PensionProductApp:
         messagebox.showinfo("提示", "打印功能需要连接打印机。报告内容已复制到剪贴板。")
 
         # 复制到剪贴板
-        import pyperclip
         try:
-            report_text = "养老金产品对比报告\n\n"
-            report_text += f"生成时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n"
-            report_text += f"对比产品数: {len(self.selected_products)}\n\n"
-
-            for row in comparison[:10]:  # 只复制前10行
-                report_text += f"{row['feature']}: "
-                for i in range(len(self.selected_products)):
-                    col_name = f'product_{i + 1}'
-                    report_text += f"产品{i + 1}: {row.get(col_name, 'N/A')} | "
-                report_text += "\n"
-
-            pyperclip.copy(report_text)
+            buf = io.StringIO()
+            buf.write("养老金产品对比报告\n\n")
+            buf.write(f"生成时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
+            buf.write(f"对比产品数: {len(self.selected_products)}\n\n")
+
+            product_keys = [f'product_{i + 1}' for i in range(len(self.selected_products))]
+            for row in comparison:
+                buf.write(f"{row['feature']}: ")
+                for i, key in enumerate(product_keys, 1):
+                    buf.write(f"产品{i}: {row.get(key, 'N/A')} | ")
+                buf.write("\n")
+
+            self.copy_to_clipboard(buf.getvalue())
             messagebox.showinfo("成功", "报告内容已复制到剪贴板")
         except:
             messagebox.showwarning("提示", "无法复制到剪贴板，请手动复制")
@@ -1584,7 +1676,7 @@ class PensionProductApp:
             messagebox.showwarning("提示", "没有对比数据可导出")
             return
 
-        comparison = self.recommender.generate_comparison_table(self.selected_products)
+        comparison = self.get_comparison_table()
 
         if not comparison:
             messagebox.showerror("错误", "无法生成对比数据")
@@ -1598,17 +1690,14 @@ class PensionProductApp:
 
         if filename:
             try:
-                # 转换为DataFrame
-                export_data = []
-                for row in comparison:
-                    export_data.append(row)
-
-                df = pd.DataFrame(export_data)
-
                 if filename.endswith('.csv'):
-                    df.to_csv(filename, index=False, encoding='utf-8-sig')
+                    # 对比表本身就是字典列表，直接写出，无需构建DataFrame
+                    with open(filename, 'w', encoding='utf-8-sig', newline='', buffering=1 << 20) as f:
+                        writer = csv.DictWriter(f, fieldnames=list(comparison[0].keys()))
+                        writer.writeheader()
+                        writer.writerows(comparison)
                 else:
-                    df.to_excel(filename, index=False)
+                    _write_xlsx(pd.DataFrame(comparison), filename)
 
                 messagebox.showinfo("成功", f"对比数据已导出到: {filename}")
             except Exception as e:
@@ -1625,24 +1714,13 @@ class PensionProductApp:
     def generate_analysis_charts(self):
         """生成分析图表"""
         try:
-            # 设置中文字体
-            plt.rcParams['font.sans-serif'] = ['SimHei', 'DejaVu Sans']
-            plt.rcParams['axes.unicode_minus'] = False
             if self.analyzer.processed_df is None:
                 messagebox.showwarning("提示", "请先处理数据")
                 return
 
-            # 清除现有图表
-            for widget in self.chart_canvas_frame.winfo_children():
-                widget.destroy()
-
             analysis_type = self.analysis_type_var.get()
             chart_type = self.chart_type_var.get()
 
-            # 创建图形
-            fig = Figure(figsize=(10, 6), dpi=100)
-            ax = fig.add_subplot(111)
-
             # 根据分析类型获取数据
             if analysis_type == "产品类型分布":
                 data = self.analyzer.processed_df['insurance_type'].value_counts()
@@ -1702,6 +1780,20 @@ class PensionProductApp:
                 messagebox.showwarning("提示", "请选择分析类型")
                 return
 
+            # 首次使用时创建图形和画布
+            if self._fig is None:
+                mpl = self._ensure_mpl()
+                self._fig = mpl.Figure(figsize=(10, 6), dpi=100)
+                self._ax = self._fig.add_subplot(111)
+                self._canvas = mpl.FigureCanvasTkAgg(self._fig, self.chart_canvas_frame)
+                self._canvas.get_tk_widget().grid(row=0, column=0, sticky=(tk.W, tk.E, tk.N, tk.S))
+
+            # 复用已有的图形和画布，重建坐标轴
+            # （饼图会修改纵横比并隐藏边框，ax.clear()不会全部还原）
+            fig = self._fig
+            fig.clear()
+            ax = self._ax = fig.add_subplot(111)
+
             # 根据图表类型绘制
             if chart_type == "柱状图":
                 x_pos = range(len(data))
@@ -1744,14 +1836,9 @@ class PensionProductApp:
             # 调整布局
             fig.tight_layout()
 
-            # 将图表嵌入Tkinter
-            canvas = FigureCanvasTkAgg(fig, self.chart_canvas_frame)
-            canvas.draw()
-            canvas.get_tk_widget().grid(row=0, column=0, sticky=(tk.W, tk.E, tk.N, tk.S))
-
-            # 配置网格权重
-            self.chart_canvas_frame.columnconfigure(0, weight=1)
-            self.chart_canvas_frame.rowconfigure(0, weight=1)
+            # 刷新画布
+            self._canvas.draw_idle()
+            self.current_figure = fig
 
             # 更新统计摘要
             self.update_summary_text()
@@ -1777,17 +1864,30 @@ class PensionProductApp:
 
         if filename:
             try:
-                self.current_figure.savefig(filename, dpi=300, bbox_inches='tight')
+                save_kwargs = {}
+                if self.save_tight_var.get():
+                    save_kwargs['bbox_inches'] = 'tight'
+                if not filename.lower().endswith('.pdf'):
+                    # PDF为矢量格式，不需要指定分辨率
+                    save_kwargs['dpi'] = self.save_dpi_var.get() or 150
+                self.current_figure.savefig(filename, **save_kwargs)
                 messagebox.showinfo("成功", f"图表已保存到: {filename}")
             except Exception as e:
                 messagebox.showerror("错误", f"保存图表时出错: {str(e)}")
 
+    def get_summary_statistics(self):
+        """获取数据统计摘要，数据未变化时复用上次结果"""
+        df = self.analyzer.processed_df
+        if self._summary_cache is None or self._summary_cache[0] is not df:
+            self._summary_cache = (df, self.analyzer.get_summary_statistics())
+        return self._summary_cache[1]
+
     def update_summary_text(self):
         """更新统计摘要文本"""
         if self.analyzer.processed_df is None:
             return
 
-        summary = self.analyzer.get_summary_statistics()
+        summary = self.get_summary_statistics()
 
         self.summary_text.delete(1.0, tk.END)
 
@@ -1870,41 +1970,34 @@ class PensionProductApp:
             messagebox.showerror("错误", "无法获取当前产品信息")
             return
 
-        # 查找类似产品（同类型、同风险等级）
-        similar_products = []
-        for _, product in self.analyzer.processed_df.iterrows():
-            if product['product_id'] == self.current_product_id:
-                continue
-
-            # 相似度评分
-            similarity = 0
-
-            if product['insurance_type'] == current_product['insurance_type']:
-                similarity += 30
+        # 查找类似产品（同类型、同风险等级），按列整体计算相似度
+        arrays = self._get_similarity_arrays()
+        similarity = np.zeros(len(arrays['pid']))
 
-            if product['risk_level'] == current_product['risk_level']:
-                similarity += 25
+        similarity += np.where(arrays['ins_type'] == current_product['insurance_type'], 30, 0)
+        similarity += np.where(arrays['risk'] == current_product['risk_level'], 25, 0)
+        similarity += np.where(arrays['company'] == current_product['insurance_company'], 20, 0)
 
-            if product['insurance_company'] == current_product['insurance_company']:
-                similarity += 20
+        # 保费相近
+        current_premium = current_product.get('min_premium', 0)
+        product_premium = arrays['min_prem']
+        if current_premium > 0:
+            with np.errstate(invalid='ignore', divide='ignore'):
+                ratio = (np.minimum(current_premium, product_premium) /
+                         np.maximum(current_premium, product_premium))
+            similarity += np.where(product_premium > 0, ratio, 0) * 15
 
-            # 保费相近
-            current_premium = current_product.get('min_premium', 0)
-            product_premium = product.get('min_premium', 0)
-            if current_premium > 0 and product_premium > 0:
-                ratio = min(current_premium, product_premium) / max(current_premium, product_premium)
-                similarity += ratio * 15
+        # 年龄要求相近
+        similarity += np.where((arrays['min_age'] == current_product.get('min_age')) &
+                               (arrays['max_age'] == current_product.get('max_age')), 10, 0)
 
-            # 年龄要求相近
-            if (product['min_age'] == current_product.get('min_age') and
-                    product['max_age'] == current_product.get('max_age')):
-                similarity += 10
+        # 相似度阈值，排除当前产品
+        candidates = np.flatnonzero((similarity > 40) & (arrays['pid'] != self.current_product_id))
 
-            if similarity > 40:  # 相似度阈值
-                similar_products.append((similarity, product.to_dict()))
-
-        # 按相似度排序
-        similar_products.sort(key=lambda x: x[0], reverse=True)
+        # 按相似度排序（相同分数保持原有顺序）
+        candidates = candidates[np.argsort(-similarity[candidates], kind='stable')]
+        similar_products = [(similarity[i], self.analyzer.get_product_details(arrays['pid'][i]))
+                            for i in candidates[:10]]
 
         if not similar_products:
             messagebox.showinfo("提示", "未找到类似产品")
@@ -1953,19 +2046,13 @@ class PensionProductApp:
         for col, width in column_widths.items():
             tree.column(col, width=width)
 
-        # 添加数据
-        for similarity, product in similar_products[:10]:  # 最多显示10个
-            tree.insert('', 'end',
-                        values=(
-                            product['product_name'],
-                            product['insurance_company'],
-                            f"{similarity:.1f}%",
-                            product['insurance_type'],
-                            product['risk_level'],
-                            product['min_premium_str']
-                        ),
-                        tags=(product['product_id'],)
-                        )
+        # 添加数据（最多显示10个）
+        _bulk_insert(tree, (
+            {'values': (product['product_name'], product['insurance_company'], f"{similarity:.1f}%",
+                        product['insurance_type'], product['risk_level'], product['min_premium_str']),
+             'tags': (product['product_id'],)}
+            for similarity, product in similar_products
+        ))
 
         # 添加滚动条
         scrollbar = ttk.Scrollbar(similar_window, orient=tk.VERTICAL, command=tree.yview)
@@ -1988,6 +2075,22 @@ class PensionProductApp:
         ttk.Button(button_frame, text="关闭",
                    command=similar_window.destroy).pack(side=tk.LEFT, padx=5)
 
+    def _get_similarity_arrays(self):
+        """获取查找类似产品所需的列数组，processed_df变化时重建"""
+        df = self.analyzer.processed_df
+        if self._sim_arrays is None or self._sim_arrays_df is not df:
+            self._sim_arrays = {
+                'ins_type': df['insurance_type'].to_numpy(),
+                'risk': df['risk_level'].to_numpy(),
+                'company': df['insurance_company'].to_numpy(),
+                'min_prem': df['min_premium'].to_numpy(np.float64),
+                'min_age': df['min_age'].to_numpy(),
+                'max_age': df['max_age'].to_numpy(),
+                'pid': df['product_id'].to_numpy()
+            }
+            self._sim_arrays_df = df
+        return self._sim_arrays
+
     def view_similar_product(self, tree):
         """查看选中的类似产品"""
         selection = tree.selection()
@@ -2062,7 +2165,7 @@ class PensionProductApp:
 
         if filename:
             try:
-                with open(filename, 'w', encoding='utf-8') as f:
+                with open(filename, 'w', encoding='utf-8', buffering=1 << 16) as f:
                     json.dump(profile, f, ensure_ascii=False, indent=2)
                 messagebox.showinfo("成功", f"用户配置已保存到: {filename}")
             except Exception as e:
@@ -2078,7 +2181,7 @@ class PensionProductApp:
         if filename:
             try:
                 with open(filename, 'r', encoding='utf-8') as f:
-                    profile = json.load(f)
+                    profile = json.loads(f.read())
 
                 # 加载到界面
                 self.age_var.set(profile.get('age', 30))
@@ -2202,7 +2305,7 @@ class PensionProductApp:
         title_label.pack(pady=(20, 10))
 
         # 统计信息
-        summary = self.analyzer.get_summary_statistics()
+        summary = self.get_summary_statistics()
 
         # 创建文本框
         stats_text = scrolledtext.ScrolledText(stats_window, font=('微软雅黑', 11))
@@ -5,17 +5,61 @@ main.py - 养老金产品搜索与决策工具主程序
 
 import sys
 import os
-import tkinter as tk
-from tkinter import messagebox
-import traceback
+import atexit
+import logging
 
-# 添加当前目录到Python路径
-sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+_SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# 添加当前目录到Python路径（已存在时跳过），放在最前面避免被同名第三方模块遮蔽
+if _SCRIPT_DIR not in sys.path:
+    sys.path.insert(0, _SCRIPT_DIR)
 
 # 导入自定义模块
 from data_processor import PensionProductAnalyzer
 from recommender import PensionProductRecommender
-from gui_interface import PensionProductApp
+
+log = logging.getLogger("pension")
+
+# 启动横幅
+_BANNER = "\n".join([
+    "=" * 60,
+    "个人养老金产品搜索与决策工具",
+    "版本 1.0",
+    "=" * 60,
+])
+
+# 命令行模式菜单
+_MENU = "\n命令:\n  1. 搜索产品\n  2. 查看产品列表\n  3. 获取推荐\n  4. 退出"
+
+# 数据文件可能的路径，按优先级排列
+_DATA_CANDIDATES = (
+    '养老保险.xlsx',  # 当前目录
+    'data/养老保险.xlsx',  # data子目录
+    '../养老保险.xlsx',  # 上级目录
+    './养老保险_sample.xlsx',  # 示例文件
+    os.path.join(_SCRIPT_DIR, '养老保险.xlsx')
+)
+
+
+def _ask(prompt, cast=str, cond=lambda x: True):
+    """
+    读取并校验命令行输入，输入无效时只重新提示当前这一项
+    Args:
+        prompt: 提示文字
+        cast: 类型转换函数
+        cond: 校验函数，返回False视为无效输入
+    Returns:
+        转换后的输入值
+    """
+    while True:
+        try:
+            value = cast(input(prompt))
+        except ValueError:
+            value = None
+        else:
+            if cond(value):
+                return value
+        print("输入错误，请重试")
 
 
 class PensionProductTool:
@@ -26,20 +70,28 @@ class PensionProductTool:
         self.recommender = None
         self.app = None
         self.data_file = None
+        self._search_index = None  # (processed_df, 小写检索文本)
+        self._saved = False  # 是否已在退出前保存过数据
 
     def find_data_file(self):
         """查找数据文件"""
-        # 可能的文件路径
-        possible_paths = [
-            '养老保险.xlsx',  # 当前目录
-            'data/养老保险.xlsx',  # data子目录
-            '../养老保险.xlsx',  # 上级目录
-            './养老保险_sample.xlsx',  # 示例文件
-            os.path.join(os.path.dirname(__file__), '养老保险.xlsx')
-        ]
-
-        for path in possible_paths:
-            if os.path.exists(path):
+        # 每个目录只读取一次，再在内存中判断候选文件是否存在（只认普通文件，忽略同名目录）
+        # 文件名不区分大小写比较，与Windows上按路径判断的结果一致
+        dir_entries = {}
+        for path in _DATA_CANDIDATES:
+            dir_name, file_name = os.path.split(path)
+            if dir_name not in dir_entries:
+                try:
+                    with os.scandir(dir_name or '.') as it:
+                        dir_entries[dir_name] = {entry.name.casefold(): entry.name for entry in it if entry.is_file()}
+                except (FileNotFoundError, NotADirectoryError, PermissionError):
+                    dir_entries[dir_name] = {}
+
+            actual_name = dir_entries[dir_name].get(file_name.casefold())
+            if actual_name is not None:
+                # 大小写不同时返回实际的文件名，区分大小写的文件系统上也能打开
+                if actual_name != file_name:
+                    path = os.path.join(dir_name, actual_name)
                 print(f"找到数据文件: {path}")
                 return path
 
@@ -52,10 +104,7 @@ class PensionProductTool:
 
     def setup(self):
         """设置工具"""
-        print("=" * 60)
-        print("个人养老金产品搜索与决策工具")
-        print("版本 1.0")
-        print("=" * 60)
+        print(_BANNER)
 
         # 查找数据文件
         self.data_file = self.find_data_file()
@@ -79,20 +128,55 @@ class PensionProductTool:
             print(
                 f"数据处理完成: {len(self.analyzer.processed_df) if self.analyzer.processed_df is not None else 0} 条记录")
         except Exception as e:
-            print(f"数据处理出错: {e}")
-            traceback.print_exc()
+            log.error("数据处理出错: %s", e)
+            log.debug("数据处理失败的异常堆栈", exc_info=True)
             return False
 
         # 创建推荐器
         print("正在初始化推荐系统...")
         self.recommender = PensionProductRecommender(self.analyzer)
+        self.warm_up()
+
+        # 无论以何种方式退出，都保存数据
+        atexit.register(self.save_before_exit)
 
         print("初始化完成!")
         print("-" * 60)
         return True
 
+    def warm_up(self):
+        """用默认画像预先运行一次推荐，把首次调用的开销放在启动阶段"""
+        user_id = "_warmup"
+        try:
+            self.recommender.add_user_profile(user_id, {
+                'age': 35,
+                'annual_income': 10,
+                'risk_tolerance': '中',
+                'social_security_type': '城镇职工',
+                'expected_retirement_age': 60,
+                'investment_amount': 5,
+                'location': '全国'
+            })
+            self.recommender.get_recommendations(user_id, top_n=1)
+            print("预热完成")
+        except Exception as e:
+            print(f"推荐系统预热失败: {e}")
+        finally:
+            self.recommender.remove_user_profile(user_id)
+
     def run_gui(self):
         """运行GUI界面"""
+        # 图形界面相关模块只在GUI模式下导入
+        try:
+            import tkinter as tk
+            from tkinter import messagebox
+            from gui_interface import PensionProductApp
+        except ImportError as e:
+            print(f"无法加载图形界面组件: {e}")
+            print("将切换到命令行模式")
+            self.run_command_line()
+            return True
+
         try:
             root = tk.Tk()
 
@@ -116,14 +200,18 @@ class PensionProductTool:
             root.mainloop()
 
         except Exception as e:
-            print(f"GUI运行出错: {e}")
-            traceback.print_exc()
+            log.error("GUI运行出错: %s", e)
+            log.debug("GUI运行失败的异常堆栈", exc_info=True)
             return False
 
         return True
 
     def save_before_exit(self):
-        """退出前保存数据"""
+        """退出前保存数据（只执行一次）"""
+        if self._saved:
+            return
+        self._saved = True
+
         try:
             # 保存处理后的数据
             if self.analyzer and self.analyzer.processed_df is not None:
@@ -137,6 +225,20 @@ class PensionProductTool:
         except Exception as e:
             print(f"保存数据时出错: {e}")
 
+    def search_products(self, keyword):
+        """命令行搜索产品，检索文本按数据集缓存，重复搜索时不再逐列转换小写"""
+        df = self.analyzer.processed_df
+        # 按对象身份比较processed_df，id()在旧数据释放后可能被新数据复用
+        if self._search_index is None or self._search_index[0] is not df:
+            # 各字段用换行分隔，避免关键词跨字段匹配
+            text = df['product_name'].fillna('').astype(str)
+            for col in ('insurance_company', 'insurance_type', 'features'):
+                text = text + '\n' + df[col].astype(object).fillna('').astype(str)
+            self._search_index = (df, text.str.lower())
+
+        mask = self._search_index[1].str.contains(keyword.lower(), regex=False)
+        return df[mask]
+
     def run_command_line(self):
         """运行命令行界面"""
         print("\n命令行模式")
@@ -152,68 +254,65 @@ class PensionProductTool:
         print(f"保险公司数: {summary.get('total_companies', 0)}")
 
         # 显示产品类型分布
-        print("\n产品类型分布:")
         type_dist = summary.get('type_distribution', {})
-        for type_name, count in type_dist.items():
-            print(f"  {type_name}: {count}")
+        lines = ["\n产品类型分布:"]
+        lines.extend(f"  {type_name}: {count}" for type_name, count in type_dist.items())
+        sys.stdout.write('\n'.join(lines) + '\n')
 
         # 简单交互
         while True:
-            print("\n命令:")
-            print("  1. 搜索产品")
-            print("  2. 查看产品列表")
-            print("  3. 获取推荐")
-            print("  4. 退出")
+            print(_MENU)
 
             choice = input("\n请选择 (1-4): ").strip()
 
             if choice == '1':
                 keyword = input("请输入搜索关键词: ").strip()
                 if keyword:
-                    results = self.analyzer.search_products(keyword)
-                    print(f"\n找到 {len(results)} 个产品:")
-                    for _, row in results.head(5).iterrows():
-                        print(f"  - {row['product_name']} ({row['insurance_company']})")
+                    results = self.search_products(keyword)
+                    lines = [f"\n找到 {len(results)} 个产品:"]
+                    top = results[['product_name', 'insurance_company']].head(5)
+                    lines.extend(f"  - {name} ({company})"
+                                 for name, company in top.itertuples(index=False, name=None))
+                    sys.stdout.write('\n'.join(lines) + '\n')
 
             elif choice == '2':
-                print("\n产品列表 (前10个):")
-                for _, row in self.analyzer.processed_df.head(10).iterrows():
-                    print(f"  - {row['product_name']} | {row['insurance_company']} | {row['age_range_str']}")
+                lines = ["\n产品列表 (前10个):"]
+                top = self.analyzer.processed_df[['product_name', 'insurance_company', 'age_range_str']].head(10)
+                lines.extend(f"  - {name} | {company} | {age_range}"
+                             for name, company, age_range in top.itertuples(index=False, name=None))
+                sys.stdout.write('\n'.join(lines) + '\n')
 
             elif choice == '3':
                 print("\n请输入用户信息:")
-                try:
-                    age = int(input("年龄: "))
-                    income = float(input("年收入(万元): "))
-                    risk = input("风险偏好(低/中/高): ")
-                    ss_type = input("社保类型(城镇职工/城乡居民/无): ")
-
-                    user_profile = {
-                        'age': age,
-                        'annual_income': income,
-                        'risk_tolerance': risk,
-                        'social_security_type': ss_type,
-                        'expected_retirement_age': 60,
-                        'investment_amount': income * 0.5,
-                        'location': '全国'
-                    }
-
-                    user_id = "cli_user"
-                    self.recommender.add_user_profile(user_id, user_profile)
-                    result = self.recommender.get_recommendations(user_id, top_n=3)
-
-                    if "recommendations" in result:
-                        print(f"\n推荐产品 ({len(result['recommendations'])}个):")
-                        for rec in result['recommendations']:
-                            print(f"\n  {rec['product_name']}")
-                            print(f"    保险公司: {rec['insurance_company']}")
-                            print(f"    匹配度: {rec['match_score']}%")
-                            print(f"    风险等级: {rec['risk_level']}")
-                    else:
-                        print(f"错误: {result.get('error', '未知错误')}")
-
-                except ValueError:
-                    print("输入错误，请重新输入")
+                age = _ask("年龄: ", int, lambda x: 18 <= x <= 100)
+                income = _ask("年收入(万元): ", float, lambda x: x >= 0)
+                risk = input("风险偏好(低/中/高): ")
+                ss_type = input("社保类型(城镇职工/城乡居民/无): ")
+
+                user_profile = {
+                    'age': age,
+                    'annual_income': income,
+                    'risk_tolerance': risk,
+                    'social_security_type': ss_type,
+                    'expected_retirement_age': 60,
+                    'investment_amount': income * 0.5,
+                    'location': '全国'
+                }
+
+                user_id = "cli_user"
+                self.recommender.add_user_profile(user_id, user_profile)
+                result = self.recommender.get_recommendations(user_id, top_n=3)
+
+                if "recommendations" in result:
+                    lines = [f"\n推荐产品 ({len(result['recommendations'])}个):"]
+                    for rec in result['recommendations']:
+                        lines.append(f"\n  {rec['product_name']}")
+                        lines.append(f"    保险公司: {rec['insurance_company']}")
+                        lines.append(f"    匹配度: {rec['match_score']}%")
+                        lines.append(f"    风险等级: {rec['risk_level']}")
+                    sys.stdout.write('\n'.join(lines) + '\n')
+                else:
+                    print(f"错误: {result.get('error', '未知错误')}")
 
             elif choice == '4':
                 print("退出命令行模式")
@@ -225,6 +324,15 @@ class PensionProductTool:
 
 def main():
     """主函数"""
+    args = sys.argv[1:]
+
+    # 只配置本工具的日志，不改动根日志器，避免pandas、matplotlib等库的调试信息刷屏
+    # 出错时只输出一行错误信息，--debug 时另外输出异常堆栈和调试信息
+    handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter(logging.BASIC_FORMAT))
+    log.addHandler(handler)
+    log.setLevel(logging.DEBUG if '--debug' in args else logging.WARNING)
+
     tool = PensionProductTool()
 
     # 设置工具
@@ -234,7 +342,7 @@ def main():
         return
 
     # 检查命令行参数
-    if len(sys.argv) > 1 and sys.argv[1] == '--cli':
+    if '--cli' in args:
         # 命令行模式
         tool.run_command_line()
     else:
@@ -9,21 +9,258 @@ from typing import Dict, List, Optional, Tuple, Any
 from datetime import datetime
 import json
 import os
+import logging
+import threading
+from collections import OrderedDict, deque
+
+from data_processor import KEYWORD_BITS
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    from numba import njit, prange
+except ImportError:
+    njit = None
+    prange = range
+
+# 默认不输出，由调用方配置日志（如main.py的--debug）
+log = logging.getLogger("pension.recommender")
+log.addHandler(logging.NullHandler())
+
+# 风险等级映射到数值
+_RISK_LEVELS = {
+    '低': 1,
+    '中低': 2,
+    '中': 3,
+    '中高': 4,
+    '高': 5,
+    '未知': 3  # 默认中等风险
+}
+
+# 按用户与产品风险等级差距(0、1、2、3、4及以上)给出的风险匹配分数
+_SCORE_BY_DIFF = np.array([1.0, 0.8, 0.5, 0.3, 0.1])
+
+# 评分和生成推荐结果需要的产品数据列
+_REQUIRED_COLUMNS = (
+    'product_id', 'product_name', 'insurance_company', 'min_age', 'max_age', 'age_range_str',
+    'insurance_type', 'payment_type', 'min_premium', 'min_premium_str', 'risk_level',
+    'coverage_age', 'coverage_years', 'coverage_str'
+)
+
+# 前N名选取结果缓存的最大条目数
+_RECOMMENDATION_CACHE_SIZE = 64
+
+# 每个用户保留的推荐历史条数
+_HISTORY_MAXLEN = 50
+
+# 各项匹配分数的名称，顺序与_fused_total_score_kernel的权重数组一致
+_SCORE_KEYS = ('age_score', 'income_score', 'risk_score', 'retirement_score', 'ss_score', 'investment_score')
+
+# 社保匹配用到的关键词位组合
+_TYPE_PENSION = KEYWORD_BITS['养老'] | KEYWORD_BITS['年金']
+_TYPE_YANGLAO = KEYWORD_BITS['养老']
+_TYPE_DIVIDEND = KEYWORD_BITS['分红'] | KEYWORD_BITS['万能']
+_FEATURE_GUARANTEE = KEYWORD_BITS['保证'] | KEYWORD_BITS['保本']
+_FEATURE_MEDICAL = KEYWORD_BITS['医疗'] | KEYWORD_BITS['健康']
+_FEATURE_SUPPLEMENT = KEYWORD_BITS['补充'] | KEYWORD_BITS['附加']
+
+# 社保类型编码，供_fused_total_score_kernel使用
+_SS_TYPE_CODES = {'无': 0, '城乡居民': 1, '城镇职工': 2}
+
+# 推荐理由模板，替换此字典即可切换语言
+_REASON_TEMPLATES = {
+    'age_high': '年龄{age}岁非常适合此产品',
+    'age_mid': '年龄{age}岁在适合范围内',
+    'income_high': '保费在您的合理承受范围内',
+    'income_mid': '保费与您的收入水平匹配',
+    'risk_match': '风险等级({product_risk})与您的风险偏好({user_risk})匹配',
+    'coverage_age': '保障至{age}岁，与您的退休规划契合',
+    'coverage_years': '保障{years}年，适合您的长期规划',
+    'ss_none': '适合无社保用户，提供全面保障',
+    'ss_match': '适合{ss_type}社保用户',
+    'pension': '这是一款养老产品，适合长期退休规划',
+    'low_risk': '低风险产品，资金安全有保障',
+    'dividend': '分红型产品，有机会获得额外收益',
+}
+
+
+def _fmax(a, b):
+    """两数取较大值，其中一个为NaN时返回另一个，与np.fmax一致"""
+    if b != b:
+        return a
+    if a != a:
+        return b
+    return a if a >= b else b
+
+
+def _fused_total_score_kernel(min_age, max_age, min_premium, premium_factor, risk_level, coverage_age,
+                              coverage_years, type_bits, feature_bits,
+                              user_age, user_income, user_risk, user_ss, retirement_age, investment, weights):
+    """
+    逐产品计算加权总分，六项分数在一次循环内完成，不生成中间数组
+    安装numba时编译执行，逻辑与各_calculate_*_match_score方法一致
+    Returns:
+        加权总分数组
+    """
+    n = min_age.shape[0]
+    total = np.empty(n)
+    income_base = user_income * 10000 * 0.15
+    investment_yuan = investment * 10000
+    expected_years = retirement_age - 30
+    if expected_years <= 0:
+        expected_years = 20
+
+    for i in prange(n):
+        # 年龄匹配
+        lower = min_age[i]
+        upper = max_age[i]
+        if np.isnan(lower) and np.isnan(upper):
+            age_score = 0.5
+        else:
+            if np.isnan(lower):
+                lower = 0.0
+            if np.isnan(upper):
+                upper = 100.0
+            if lower <= user_age <= upper:
+                width = upper - lower
+                if width == 0:
+                    age_score = 1.0
+                else:
+                    age_score = _fmax(0.0, 1.0 - abs(user_age - (lower + upper) / 2) / width)
+            else:
+                distance = lower - user_age if user_age < lower else user_age - upper
+                age_score = _fmax(0.0, 1.0 - distance / 20)
+
+        # 收入匹配
+        premium = min_premium[i]
+        reasonable_premium = income_base * premium_factor[i]
+        if premium <= 0:
+            income_score = 0.5
+        elif premium <= reasonable_premium:
+            if premium <= reasonable_premium * 0.3:
+                income_score = 1.0
+            else:
+                income_score = _fmax(0.6, 1.0 - (premium / reasonable_premium - 0.3) * 0.5)
+        elif reasonable_premium == 0:
+            income_score = 0.0
+        else:
+            income_score = _fmax(0.0, 1.0 - (premium / reasonable_premium - 1.0) * 0.5)
+
+        # 风险匹配
+        diff = abs(user_risk - risk_level[i])
+        if diff == 0:
+            risk_score = 1.0
+        elif diff == 1:
+            risk_score = 0.8
+        elif diff == 2:
+            risk_score = 0.5
+        elif diff == 3:
+            risk_score = 0.3
+        else:
+            risk_score = 0.1
+
+        # 退休规划匹配
+        if not np.isnan(coverage_age[i]):
+            age_diff = abs(coverage_age[i] - retirement_age)
+            if age_diff <= 5:
+                retirement_score = 1.0
+            elif age_diff <= 10:
+                retirement_score = 0.7
+            elif age_diff <= 15:
+                retirement_score = 0.4
+            else:
+                retirement_score = 0.1
+        elif not np.isnan(coverage_years[i]):
+            years_diff = abs(coverage_years[i] - expected_years)
+            if years_diff <= 5:
+                retirement_score = 0.8
+            elif years_diff <= 10:
+                retirement_score = 0.5
+            else:
+                retirement_score = 0.2
+        else:
+            retirement_score = 0.5
+
+        # 社保匹配
+        if user_ss == 0:
+            if type_bits[i] & _TYPE_PENSION:
+                ss_score = 1.0 if feature_bits[i] & _FEATURE_GUARANTEE else 0.7
+            else:
+                ss_score = 0.9 if feature_bits[i] & _FEATURE_MEDICAL else 0.3
+        elif user_ss == 1:
+            if feature_bits[i] & _FEATURE_SUPPLEMENT:
+                ss_score = 0.9
+            else:
+                ss_score = 0.7 if type_bits[i] & _TYPE_YANGLAO else 0.5
+        elif user_ss == 2:
+            if type_bits[i] & _TYPE_DIVIDEND:
+                ss_score = 0.8
+            else:
+                ss_score = 0.6 if type_bits[i] & _TYPE_YANGLAO else 0.4
+        else:
+            ss_score = 0.5
+
+        # 投资金额匹配
+        if premium <= 0:
+            investment_score = 0.5
+        elif investment_yuan >= premium * 3:
+            investment_score = 1.0
+        elif investment_yuan >= premium:
+            investment_score = 0.5 + (investment_yuan / premium - 1) * 0.25
+        else:
+            investment_score = _fmax(0.1, investment_yuan / premium * 0.5)
+
+        total[i] = (age_score * weights[0] + income_score * weights[1] + risk_score * weights[2] +
+                    retirement_score * weights[3] + ss_score * weights[4] + investment_score * weights[5])
+
+    return total
+
+
+if njit is not None:
+    _fmax = njit(cache=True)(_fmax)
+    _fused_total_score_kernel = njit(parallel=True, cache=True)(_fused_total_score_kernel)
+
+
+def _top_n_order(values: np.ndarray, top_n: int) -> np.ndarray:
+    """
+    取最大的top_n个元素的下标，按值从大到小排列，值相同时保持原顺序，NaN视为最小值
+    结果与NaN替换为-inf后的np.argsort(-values, kind='stable')[:top_n]相同，但只对入选元素排序
+    """
+    # np.partition把NaN排在最大处，不替换的话第top_n大的值可能是NaN，导致入选数量不足
+    values = np.where(np.isnan(values), -np.inf, values)
+    n = len(values)
+    if top_n <= 0 or top_n >= n:
+        return np.argsort(-values, kind='stable')[:top_n]
+
+    # 第top_n大的值，大于它的全部入选，等于它的按下标顺序补足
+    kth = np.partition(values, n - top_n)[n - top_n]
+    above = np.flatnonzero(values > kth)
+    ties = np.flatnonzero(values == kth)[:top_n - len(above)]
+    candidates = np.sort(np.concatenate([above, ties]))
+    return candidates[np.argsort(-values[candidates], kind='stable')]
 
 
 class PensionProductRecommender:
     """个人养老金产品推荐系统"""
 
-    def __init__(self, analyzer):
+    def __init__(self, analyzer, history_maxlen: int = _HISTORY_MAXLEN):
         """
         初始化推荐系统
         Args:
             analyzer: PensionProductAnalyzer实例
+            history_maxlen: 每个用户保留的推荐历史条数，超出时丢弃最早的记录
         """
         self.analyzer = analyzer
+        self.history_maxlen = history_maxlen
         self.user_profiles = {}
-        self.recommendation_history = {}
+        self.recommendation_history = {}  # 用户ID -> deque(推荐记录)
         self.weights = self._get_default_weights()
+        self._scoring_cache = (None, None)  # (processed_df, 评分用的列数组)
+        self._recommendation_cache = OrderedDict()  # 相同画像和条件的前N名选取结果(LRU)
+        self._cache_lock = threading.Lock()  # 保护_recommendation_cache，dify服务会并发调用
 
     def _get_default_weights(self) -> Dict:
         """获取默认权重配置"""
@@ -43,6 +280,7 @@ class PensionProductRecommender:
         if abs(total - 1.0) > 0.001:
             raise ValueError(f"权重总和必须为1.0，当前为{total}")
         self.weights = weights
+        self._clear_recommendation_cache()
 
     def add_user_profile(self, user_id: str, profile: Dict):
         """添加用户画像"""
@@ -52,11 +290,82 @@ class PensionProductRecommender:
 
         # 记录添加时间
         if user_id not in self.recommendation_history:
-            self.recommendation_history[user_id] = []
+            self.recommendation_history[user_id] = self._new_history()
 
-        print(f"用户画像已添加/更新: {user_id}")
+        log.debug("用户画像已添加/更新: %s", user_id)
         return validated_profile
 
+    def add_user_profiles(self, profiles: Dict[str, Dict]) -> Dict[str, List[str]]:
+        """
+        批量添加用户画像，校验规则与add_user_profile相同，按列一次完成校验且不逐个输出提示
+        Args:
+            profiles: 用户ID到用户画像的字典
+
+        Returns:
+            用户ID到警告信息列表的字典，只包含有警告的用户
+        """
+        if not profiles:
+            return {}
+
+        df = pd.DataFrame.from_dict(profiles, orient='index')
+
+        # 必需字段
+        for field in ('age', 'annual_income', 'risk_tolerance', 'social_security_type'):
+            missing = df.index if field not in df.columns else df.index[df[field].isna()]
+            if len(missing):
+                raise ValueError(f"用户{missing[0]}缺少必需字段: {field}")
+
+        # 验证年收入
+        negative = df.index[df['annual_income'] < 0]
+        if len(negative):
+            raise ValueError(f"用户{negative[0]}的年收入不能为负数")
+
+        warnings = {}
+        for user_id in df.index[~df['age'].between(18, 70)]:
+            warnings.setdefault(user_id, []).append(f"年龄{profiles[user_id]['age']}超出常规范围(18-70)")
+
+        # 验证风险承受能力和社保类型，不在标准范围内的统一调整
+        risk_tolerance = df['risk_tolerance'].where(df['risk_tolerance'].isin(['低', '中低', '中', '中高', '高']), '中')
+        for user_id, value in df.loc[risk_tolerance != df['risk_tolerance'], 'risk_tolerance'].items():
+            warnings.setdefault(user_id, []).append(f"风险承受能力'{value}'不在标准范围内，已调整为'中'")
+
+        ss_type = df['social_security_type'].where(
+            df['social_security_type'].isin(['城镇职工', '城乡居民', '无', '其他']), '城镇职工')
+        for user_id, value in df.loc[ss_type != df['social_security_type'], 'social_security_type'].items():
+            warnings.setdefault(user_id, []).append(f"社保类型'{value}'不在标准范围内，已调整为'城镇职工'")
+
+        # 保留原始值的类型，只替换调整过的字段并补充缺省字段
+        for user_id, profile in profiles.items():
+            validated = profile.copy()
+            validated['risk_tolerance'] = risk_tolerance[user_id]
+            validated['social_security_type'] = ss_type[user_id]
+            defaults = {
+                'expected_retirement_age': 60,
+                'investment_amount': validated['annual_income'] * 0.5,
+                'location': '全国',
+                'investment_horizon': '长期',
+                'liquidity_needs': '中等',
+                'health_status': '良好',
+                'family_status': '未婚无子女'
+            }
+            for key, default_value in defaults.items():
+                validated.setdefault(key, default_value)
+
+            self.user_profiles[user_id] = validated
+            if user_id not in self.recommendation_history:
+                self.recommendation_history[user_id] = self._new_history()
+
+        return warnings
+
+    def _new_history(self, records=()) -> deque:
+        """创建有长度上限的推荐历史"""
+        return deque(records, maxlen=self.history_maxlen)
+
+    def remove_user_profile(self, user_id: str):
+        """删除用户画像及其推荐历史"""
+        self.user_profiles.pop(user_id, None)
+        self.recommendation_history.pop(user_id, None)
+
     def _validate_user_profile(self, profile: Dict) -> Dict:
         """验证用户画像数据"""
         validated = profile.copy()
@@ -69,7 +378,7 @@ class PensionProductRecommender:
 
         # 验证年龄
         if not (18 <= validated['age'] <= 70):
-            print(f"警告: 年龄{validated['age']}超出常规范围(18-70)")
+            log.warning("年龄%s超出常规范围(18-70)", validated['age'])
 
         # 验证年收入
         if validated['annual_income'] < 0:
@@ -78,13 +387,13 @@ class PensionProductRecommender:
         # 验证风险承受能力
         valid_risk_levels = ['低', '中低', '中', '中高', '高']
         if validated['risk_tolerance'] not in valid_risk_levels:
-            print(f"警告: 风险承受能力'{validated['risk_tolerance']}'不在标准范围内，已调整为'中'")
+            log.warning("风险承受能力'%s'不在标准范围内，已调整为'中'", validated['risk_tolerance'])
             validated['risk_tolerance'] = '中'
 
         # 验证社保类型
         valid_social_security_types = ['城镇职工', '城乡居民', '无', '其他']
         if validated['social_security_type'] not in valid_social_security_types:
-            print(f"警告: 社保类型'{validated['social_security_type']}'不在标准范围内，已调整为'城镇职工'")
+            log.warning("社保类型'%s'不在标准范围内，已调整为'城镇职工'", validated['social_security_type'])
             validated['social_security_type'] = '城镇职工'
 
         # 设置默认值（如果字段缺失）
@@ -106,13 +415,13 @@ class PensionProductRecommender:
 
     def _calculate_age_match_score(self, user_age: int, product_min_age: Optional[int],
                                    product_max_age: Optional[int]) -> float:
-        """计算年龄匹配分数"""
-        if product_min_age is None and product_max_age is None:
+        """计算年龄匹配分数（缺失值可以是None或NaN）"""
+        if pd.isna(product_min_age) and pd.isna(product_max_age):
             return 0.5  # 年龄信息缺失，给中等分数
 
-        if product_min_age is None:
+        if pd.isna(product_min_age):
             product_min_age = 0
-        if product_max_age is None:
+        if pd.isna(product_max_age):
             product_max_age = 100
 
         # 检查是否在年龄范围内
@@ -174,41 +483,20 @@ class PensionProductRecommender:
 
     def _calculate_risk_match_score(self, user_risk: str, product_risk: str) -> float:
         """计算风险匹配分数"""
-        # 风险等级映射到数值
-        risk_levels = {
-            '低': 1,
-            '中低': 2,
-            '中': 3,
-            '中高': 4,
-            '高': 5,
-            '未知': 3  # 默认中等风险
-        }
-
-        user_level = risk_levels.get(user_risk, 3)
-        product_level = risk_levels.get(product_risk, 3)
-
-        # 计算差异
-        diff = abs(user_level - product_level)
+        user_level = _RISK_LEVELS.get(user_risk, 3)
+        product_level = _RISK_LEVELS.get(product_risk, 3)
 
         # 差异越大分数越低
-        if diff == 0:
-            return 1.0  # 完全匹配
-        elif diff == 1:
-            return 0.8  # 相差一级
-        elif diff == 2:
-            return 0.5  # 相差两级
-        elif diff == 3:
-            return 0.3  # 相差三级
-        else:
-            return 0.1  # 相差太多
+        diff = abs(user_level - product_level)
+        return float(_SCORE_BY_DIFF[min(diff, 4)])
 
     def _calculate_retirement_match_score(self, user_retirement_age: int, product_coverage_age: Optional[int],
                                           product_coverage_years: Optional[int]) -> float:
-        """计算退休规划匹配分数"""
-        if product_coverage_age is None and product_coverage_years is None:
+        """计算退休规划匹配分数（缺失值可以是None或NaN）"""
+        if pd.isna(product_coverage_age) and pd.isna(product_coverage_years):
             return 0.5  # 保障期限信息缺失
 
-        if product_coverage_age is not None:
+        if pd.notna(product_coverage_age):
             # 产品保障至特定年龄
             age_diff = abs(product_coverage_age - user_retirement_age)
             if age_diff <= 5:
@@ -219,7 +507,7 @@ class PensionProductRecommender:
                 return 0.4  # 一般匹配
             else:
                 return 0.1  # 不匹配
-        elif product_coverage_years is not None:
+        elif pd.notna(product_coverage_years):
             # 产品保障固定年限
             # 假设用户从当前年龄开始投保
             expected_coverage_years = user_retirement_age - 30  # 简化计算
@@ -293,169 +581,493 @@ class PensionProductRecommender:
             ratio = user_investment_yuan / product_min_premium
             return max(0.1, ratio * 0.5)  # 最低0.1分
 
-    def _generate_recommendation_reasons(self, scores: Dict, product: Dict, user_profile: Dict) -> List[str]:
-        """生成推荐理由"""
+    def _generate_recommendation_reasons(self, scores: Dict, user_profile: Dict, risk_level: str,
+                                         insurance_type: str, coverage_age: Optional[float] = None,
+                                         coverage_years: Optional[float] = None) -> List[str]:
+        """生成推荐理由（只传入用到的产品字段）"""
         reasons = []
 
         # 年龄匹配理由
         age_score = scores.get('age_score', 0)
         if age_score >= 0.8:
-            reasons.append(f"年龄{user_profile['age']}岁非常适合此产品")
+            reasons.append(_REASON_TEMPLATES['age_high'].format(age=user_profile['age']))
         elif age_score >= 0.6:
-            reasons.append(f"年龄{user_profile['age']}岁在适合范围内")
+            reasons.append(_REASON_TEMPLATES['age_mid'].format(age=user_profile['age']))
 
         # 收入匹配理由
         income_score = scores.get('income_score', 0)
         if income_score >= 0.8:
-            reasons.append("保费在您的合理承受范围内")
+            reasons.append(_REASON_TEMPLATES['income_high'])
         elif income_score >= 0.6:
-            reasons.append("保费与您的收入水平匹配")
+            reasons.append(_REASON_TEMPLATES['income_mid'])
 
         # 风险匹配理由
         risk_score = scores.get('risk_score', 0)
         if risk_score >= 0.8:
-            reasons.append(f"风险等级({product['risk_level']})与您的风险偏好({user_profile['risk_tolerance']})匹配")
+            reasons.append(_REASON_TEMPLATES['risk_match'].format(product_risk=risk_level,
+                                                                  user_risk=user_profile['risk_tolerance']))
 
         # 退休规划理由
         retirement_score = scores.get('retirement_score', 0)
         if retirement_score >= 0.7:
-            if product.get('coverage_age'):
-                reasons.append(f"保障至{product['coverage_age']}岁，与您的退休规划契合")
-            elif product.get('coverage_years'):
-                reasons.append(f"保障{product['coverage_years']}年，适合您的长期规划")
+            if pd.notna(coverage_age):
+                reasons.append(_REASON_TEMPLATES['coverage_age'].format(age=coverage_age))
+            elif pd.notna(coverage_years):
+                reasons.append(_REASON_TEMPLATES['coverage_years'].format(years=coverage_years))
 
         # 社保匹配理由
         ss_score = scores.get('ss_score', 0)
         if ss_score >= 0.8:
             if user_profile['social_security_type'] == '无':
-                reasons.append("适合无社保用户，提供全面保障")
+                reasons.append(_REASON_TEMPLATES['ss_none'])
             else:
-                reasons.append(f"适合{user_profile['social_security_type']}社保用户")
+                reasons.append(_REASON_TEMPLATES['ss_match'].format(ss_type=user_profile['social_security_type']))
 
         # 如果没有足够的理由，添加通用理由
         if len(reasons) < 2:
-            if '养老' in product['insurance_type']:
-                reasons.append("这是一款养老产品，适合长期退休规划")
-            if product['risk_level'] == '低':
-                reasons.append("低风险产品，资金安全有保障")
-            if '分红' in product['insurance_type']:
-                reasons.append("分红型产品，有机会获得额外收益")
+            if '养老' in insurance_type:
+                reasons.append(_REASON_TEMPLATES['pension'])
+            if risk_level == '低':
+                reasons.append(_REASON_TEMPLATES['low_risk'])
+            if '分红' in insurance_type:
+                reasons.append(_REASON_TEMPLATES['dividend'])
 
         return reasons[:3]  # 返回最多3个理由
 
-    def get_recommendations(self, user_id: str, top_n: int = 5, filter_criteria: Dict = None) -> Dict:
+    def invalidate_cache(self):
+        """清除评分缓存和推荐结果缓存，分析器数据就地修改后调用"""
+        self._scoring_cache = (None, None)
+        self._clear_recommendation_cache()
+
+    def _clear_recommendation_cache(self):
+        """清空前N名选取结果缓存"""
+        with self._cache_lock:
+            self._recommendation_cache.clear()
+
+    def _get_scoring_view(self) -> Dict[str, np.ndarray]:
+        """
+        获取评分所需的列数组，processed_df未变化时复用上次结果
+        Returns:
+            列名到数组的字典，数组顺序与processed_df行顺序一致
+        """
+        df = self.analyzer.processed_df
+        if self._scoring_cache[0] is df:
+            return self._scoring_cache[1]
+
+        # 数据已变化，之前缓存的推荐结果失效
+        self._clear_recommendation_cache()
+
+        n = len(df)
+        type_bits, feature_bits = self.analyzer.get_keyword_bits()
+
+        # 缴费方式对合理保费的调整系数
+        premium_factor = np.ones(n)
+        premium_factor[(df['payment_type'] == '趸交').to_numpy()] = 2
+        premium_factor[df['payment_type'].isin(['月缴', '季缴']).to_numpy()] = 1.2
+
+        # 风险等级数值，分类列直接按编码查表
+        risk = df['risk_level']
+        if isinstance(risk.dtype, pd.CategoricalDtype):
+            level_by_code = np.array([_RISK_LEVELS.get(c, 3) for c in risk.cat.categories] + [3], dtype=np.int8)
+            risk_level = level_by_code[risk.cat.codes.to_numpy()]  # 编码-1(缺失)取末尾的默认值3
+        else:
+            risk_level = risk.map(_RISK_LEVELS).fillna(3).to_numpy(dtype=np.int8)
+
+        view = {
+            'min_age': df['min_age'].to_numpy(dtype=float),
+            'max_age': df['max_age'].to_numpy(dtype=float),
+            'min_premium': df['min_premium'].to_numpy(dtype=float),
+            'premium_factor': premium_factor,
+            'risk_level': risk_level,
+            'coverage_age': df['coverage_age'].to_numpy(dtype=float),
+            'coverage_years': df['coverage_years'].to_numpy(dtype=float),
+            'type_bits': type_bits,
+            'feature_bits': feature_bits,
+        }
+        self._scoring_cache = (df, view)
+        return view
+
+    def _user_arrays(self, profiles: List[Dict]) -> Dict[str, np.ndarray]:
+        """
+        把多个已验证的用户画像转换为列数组，形状为(U, 1)，可与产品数组广播
+        Args:
+            profiles: 用户画像列表
+
+        Returns:
+            字段名到数组的字典
+        """
+        def column(values, dtype=float):
+            return np.array(values, dtype=dtype).reshape(-1, 1)
+
+        incomes = [p['annual_income'] for p in profiles]
+        return {
+            'age': column([p['age'] for p in profiles]),
+            'income': column(incomes),
+            'risk_level': column([_RISK_LEVELS.get(p['risk_tolerance'], 3) for p in profiles], np.int8),
+            'ss_code': column([_SS_TYPE_CODES.get(p['social_security_type'], 3) for p in profiles], np.int8),
+            'retirement_age': column([p.get('expected_retirement_age', 60) for p in profiles]),
+            'investment': column([p.get('investment_amount', income * 0.5)
+                                  for p, income in zip(profiles, incomes)]),
+        }
+
+    def _score_products_vectorized(self, user_profile: Dict, view: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+        """
+        按列批量计算单个用户的各项匹配分数，逻辑与各_calculate_*_match_score方法一致
+        Args:
+            user_profile: 已验证的用户画像
+            view: 评分用的列数组，见_get_scoring_view
+
+        Returns:
+            分数名到分数数组的字典，数组顺序与view中数组顺序一致
+        """
+        scores = self._score_matrix(self._user_arrays([user_profile]), view)
+        return {key: values[0] for key, values in scores.items()}
+
+    def _score_matrix(self, users: Dict[str, np.ndarray], view: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+        """
+        一次矩阵运算计算U个用户对N个产品的各项匹配分数
+        Args:
+            users: 用户列数组，见_user_arrays
+            view: 评分用的列数组，见_get_scoring_view
+
+        Returns:
+            分数名到(U, N)分数矩阵的字典
+        """
+        shape = (len(users['age']), len(view['min_age']))
+        user_age = users['age']
+        user_income = users['income']
+        retirement_age = users['retirement_age']
+        investment = users['investment']
+
+        min_age = view['min_age']
+        max_age = view['max_age']
+        min_premium = view['min_premium']
+        coverage_age = view['coverage_age']
+        coverage_years = view['coverage_years']
+
+        scores = {}
+        # 下限截断用np.fmax：保费缺失(NaN)时与内置max一样得到下限分数，不让NaN进入总分
+        with np.errstate(divide='ignore', invalid='ignore'):
+            # 年龄匹配：缺失的下限按0、上限按100处理，两者都缺失给中等分数
+            lower = np.where(np.isnan(min_age), 0, min_age)
+            upper = np.where(np.isnan(max_age), 100, max_age)
+            width = upper - lower
+            center = (lower + upper) / 2
+            inside = np.where(width == 0, 1.0, np.fmax(0, 1.0 - np.abs(user_age - center) / width))
+            distance = np.where(user_age < lower, lower - user_age, user_age - upper)
+            outside = np.fmax(0, 1.0 - distance / 20)
+            in_range = (lower <= user_age) & (user_age <= upper)
+            scores['age_score'] = np.where(np.isnan(min_age) & np.isnan(max_age), 0.5,
+                                           np.where(in_range, inside, outside))
+
+            # 收入匹配：合理保费为年收入的15%，按缴费方式调整
+            reasonable_premium = user_income * 10000 * 0.15 * view['premium_factor']
+            ratio = min_premium / reasonable_premium
+            scores['income_score'] = np.select(
+                [min_premium <= 0,
+                 min_premium <= reasonable_premium * 0.3,
+                 min_premium <= reasonable_premium],
+                [0.5, 1.0, np.fmax(0.6, 1.0 - (ratio - 0.3) * 0.5)],
+                np.fmax(0, 1.0 - (ratio - 1.0) * 0.5))
+
+            # 风险匹配：按等级差距给分
+            diff = np.abs(users['risk_level'] - view['risk_level'])
+            scores['risk_score'] = _SCORE_BY_DIFF[np.minimum(diff, 4)]
+
+            # 退休规划匹配：优先按保障年龄，其次按保障年限
+            age_diff = np.abs(coverage_age - retirement_age)
+            by_age = np.select([age_diff <= 5, age_diff <= 10, age_diff <= 15], [1.0, 0.7, 0.4], 0.1)
+            expected_years = retirement_age - 30
+            expected_years = np.where(expected_years <= 0, 20, expected_years)
+            years_diff = np.abs(coverage_years - expected_years)
+            by_years = np.select([years_diff <= 5, years_diff <= 10], [0.8, 0.5], 0.2)
+            scores['retirement_score'] = np.where(~np.isnan(coverage_age), by_age,
+                                                  np.where(~np.isnan(coverage_years), by_years, 0.5))
+
+        # 社保匹配：先算出三种社保类型各自的分数，再按用户的社保类型选取
+        type_bits = view['type_bits']
+        feature_bits = view['feature_bits']
+        ss_code = users['ss_code']
+        scores['ss_score'] = np.select(
+            [ss_code == 0, ss_code == 1, ss_code == 2],
+            [np.where(type_bits & _TYPE_PENSION,
+                      np.where(feature_bits & _FEATURE_GUARANTEE, 1.0, 0.7),
+                      np.where(feature_bits & _FEATURE_MEDICAL, 0.9, 0.3)),
+             np.where(feature_bits & _FEATURE_SUPPLEMENT, 0.9,
+                      np.where(type_bits & _TYPE_YANGLAO, 0.7, 0.5)),
+             np.where(type_bits & _TYPE_DIVIDEND, 0.8,
+                      np.where(type_bits & _TYPE_YANGLAO, 0.6, 0.4))],
+            0.5)
+
+        # 投资金额匹配
+        with np.errstate(divide='ignore', invalid='ignore'):
+            investment_yuan = investment * 10000
+            ratio = investment_yuan / min_premium
+            scores['investment_score'] = np.select(
+                [min_premium <= 0,
+                 investment_yuan >= min_premium * 3,
+                 investment_yuan >= min_premium],
+                [0.5, 1.0, 0.5 + (ratio - 1) * 0.25],
+                np.fmax(0.1, ratio * 0.5))
+
+        # 只与用户有关或只与产品有关的分数广播为(U, N)
+        return {key: np.broadcast_to(values, shape) for key, values in scores.items()}
+
+    def _weighted_total(self, scores: Dict[str, np.ndarray]) -> np.ndarray:
+        """按权重合计各项分数"""
+        total = np.zeros(np.shape(scores['age_score']))
+        for key, weight in self.weights.items():
+            score_key = key.replace('_match', '_score')
+            if score_key in scores:
+                total += scores[score_key] * weight
+        return total
+
+    def _fused_total_score(self, user_profile: Dict, view: Dict[str, np.ndarray]) -> np.ndarray:
+        """用融合内核计算加权总分"""
+        # 权重按_SCORE_KEYS顺序排列，映射规则与逐项加权时相同
+        weights = np.zeros(len(_SCORE_KEYS))
+        for key, weight in self.weights.items():
+            score_key = key.replace('_match', '_score')
+            if score_key in _SCORE_KEYS:
+                weights[_SCORE_KEYS.index(score_key)] += weight
+
+        user_income = user_profile['annual_income']
+        return _fused_total_score_kernel(
+            view['min_age'], view['max_age'], view['min_premium'], view['premium_factor'], view['risk_level'],
+            view['coverage_age'], view['coverage_years'],
+            view['type_bits'], view['feature_bits'],
+            float(user_profile['age']), float(user_income),
+            _RISK_LEVELS.get(user_profile['risk_tolerance'], 3),
+            _SS_TYPE_CODES.get(user_profile['social_security_type'], 3),
+            float(user_profile.get('expected_retirement_age', 60)),
+            float(user_profile.get('investment_amount', user_income * 0.5)),
+            weights)
+
+    def _recommendation_cache_key(self, user_profile: Dict, top_n: int, filter_criteria: Optional[Dict]):
+        """生成推荐结果缓存键，画像或条件中含不可哈希的值时返回None（不使用缓存）"""
+        key = (tuple(sorted(user_profile.items())), tuple(sorted((filter_criteria or {}).items())), top_n)
+        try:
+            hash(key)
+        except TypeError:
+            return None
+        return key
+
+    def _cached_selection(self, cache_key) -> Optional[Tuple[pd.DataFrame, Dict[str, np.ndarray], np.ndarray, int]]:
+        """取缓存的前N名选取结果，没有时返回None"""
+        if cache_key is None:
+            return None
+        with self._cache_lock:
+            selection = self._recommendation_cache.get(cache_key)
+            if selection is not None:
+                self._recommendation_cache.move_to_end(cache_key)
+            return selection
+
+    def _cache_selection(self, cache_key, selection: Tuple[pd.DataFrame, Dict[str, np.ndarray], np.ndarray, int]):
+        """缓存前N名选取结果，超出容量时丢弃最久未使用的条目"""
+        if cache_key is None:
+            return
+        with self._cache_lock:
+            self._recommendation_cache[cache_key] = selection
+            self._recommendation_cache.move_to_end(cache_key)
+            if len(self._recommendation_cache) > _RECOMMENDATION_CACHE_SIZE:
+                self._recommendation_cache.popitem(last=False)
+
+    def _select_top_products(self, user_profile: Dict, view: Dict[str, np.ndarray], top_n: int,
+                             filter_criteria: Optional[Dict]) -> Tuple[pd.DataFrame, Dict[str, np.ndarray],
+                                                                       np.ndarray, int]:
+        """
+        为用户画像评分并选出前N个产品
+        Returns:
+            (入选产品, 入选产品的各项分数, 入选产品的加权总分, 参与评估的产品数)，三者顺序均为推荐顺序
+        """
+        # 获取所有产品或根据过滤条件筛选
+        products_df = self.analyzer.processed_df
+        if filter_criteria:
+            mask = self._filter_mask(filter_criteria)
+            products_df = products_df[mask]
+            view = {key: values[mask] for key, values in view.items()}
+
+        if products_df.empty:
+            return products_df, {}, np.empty(0), 0
+
+        if njit is not None:
+            # 融合内核一次算出加权总分，各项明细分数只为前N个产品计算
+            total_score = self._fused_total_score(user_profile, view)
+            order = _top_n_order(np.round(total_score * 100, 1), top_n)
+            scores = self._score_products_vectorized(user_profile, {k: v[order] for k, v in view.items()})
+        else:
+            # 批量计算每个产品的匹配分数
+            scores = self._score_products_vectorized(user_profile, view)
+
+            # 计算加权总分
+            total_score = self._weighted_total(scores)
+
+            # 按匹配分数（百分制，保留一位小数）排序，分数相同时保持原顺序
+            order = _top_n_order(np.round(total_score * 100, 1), top_n)
+            scores = {k: v[order] for k, v in scores.items()}
+
+        return products_df.iloc[order], scores, total_score[order], len(products_df)
+
+    def _build_recommendations(self, top_df: pd.DataFrame, scores: Dict[str, np.ndarray],
+                               total_score: np.ndarray, user_profile: Dict) -> List[Dict]:
+        """
+        为入选产品生成推荐理由和结果
+        Args:
+            top_df: 入选产品，按推荐顺序排列
+            scores: 入选产品的各项分数
+            total_score: 入选产品的加权总分
+            user_profile: 已验证的用户画像
+
+        Returns:
+            推荐结果列表
+        """
+        top_recommendations = []
+        # 入选产品一次性转换为字典列表，不再逐行构造Series
+        products = top_df.to_dict('records')
+        for rank, product in enumerate(products):
+            product_scores = {k: float(v[rank]) for k, v in scores.items()}
+
+            # 生成推荐理由
+            reasons = self._generate_recommendation_reasons(
+                product_scores, user_profile, product['risk_level'], product['insurance_type'],
+                product.get('coverage_age'), product.get('coverage_years'))
+
+            # 构建推荐结果
+            recommendation = {
+                'product_id': product['product_id'],
+                'product_name': product['product_name'],
+                'insurance_company': product['insurance_company'],
+                'match_score': round(float(total_score[rank]) * 100, 1),  # 转换为百分制
+                'age_range': product['age_range_str'],
+                'insurance_type': product['insurance_type'],
+                'payment_type': product['payment_type'],
+                'min_premium': product['min_premium_str'],
+                'risk_level': product['risk_level'],
+                'coverage': product['coverage_str'],
+                'recommendation_reasons': reasons,
+                'detailed_scores': {k: round(v, 3) for k, v in product_scores.items()},
+                'product_details': product
+            }
+
+            top_recommendations.append(recommendation)
+
+        return top_recommendations
+
+    def _build_recommendation_frame(self, top_df: pd.DataFrame, scores: Dict[str, np.ndarray],
+                                    total_score: np.ndarray, user_profile: Dict) -> pd.DataFrame:
+        """
+        以DataFrame形式生成推荐结果，按列构建，各项分数展开为单独的列，不含完整产品数据
+        Args:
+            top_df: 入选产品，按推荐顺序排列
+            scores: 入选产品的各项分数
+            total_score: 入选产品的加权总分
+            user_profile: 已验证的用户画像
+
+        Returns:
+            每行一个推荐产品的DataFrame
+        """
+        # 推荐理由仍需逐个生成，只涉及前N个产品
+        reasons = [
+            self._generate_recommendation_reasons(
+                {k: float(v[rank]) for k, v in scores.items()}, user_profile, risk_level, insurance_type,
+                coverage_age, coverage_years)
+            for rank, (risk_level, insurance_type, coverage_age, coverage_years) in enumerate(zip(
+                top_df['risk_level'], top_df['insurance_type'], top_df['coverage_age'], top_df['coverage_years']))
+        ]
+
+        # top_df来自缓存，复制列数据，调用方修改结果不会影响缓存
+        frame = pd.DataFrame({
+            'product_id': top_df['product_id'].to_numpy(),
+            'product_name': top_df['product_name'].to_numpy(),
+            'insurance_company': top_df['insurance_company'].to_numpy(),
+            'match_score': [round(float(t) * 100, 1) for t in total_score],  # 与字典格式相同的舍入
+            'age_range': top_df['age_range_str'].to_numpy(),
+            'insurance_type': top_df['insurance_type'].to_numpy(),
+            'payment_type': top_df['payment_type'].to_numpy(),
+            'min_premium': top_df['min_premium_str'].to_numpy(),
+            'risk_level': top_df['risk_level'].to_numpy(),
+            'coverage': top_df['coverage_str'].to_numpy(),
+            'recommendation_reasons': pd.Series(reasons, dtype=object),
+        }, copy=True)
+        for key, values in scores.items():
+            frame[key] = [round(float(v), 3) for v in values]
+        return frame
+
+    def get_recommendations(self, user_id: str, top_n: int = 5, filter_criteria: Dict = None,
+                            output: str = 'dict') -> Dict:
         """
         获取推荐产品
         Args:
             user_id: 用户ID
             top_n: 返回前N个推荐
             filter_criteria: 过滤条件，如{'insurance_type': '养老年金', 'risk_level': '低'}
+            output: 'dict'时推荐列表为字典列表；'dataframe'时为DataFrame（各项分数为单独的列，不含完整产品数据）
 
         Returns:
             推荐结果字典
         """
+        if output not in ('dict', 'dataframe'):
+            raise ValueError(f"不支持的输出格式: {output}")
+
         if user_id not in self.user_profiles:
             return {"error": "用户不存在", "recommendations": []}
 
         if self.analyzer.processed_df is None:
             return {"error": "数据未处理", "recommendations": []}
 
-        user_profile = self.user_profiles[user_id]
+        # 所有产品结构相同，缺列时整体报错，不再逐个产品捕获异常
+        missing = [col for col in _REQUIRED_COLUMNS if col not in self.analyzer.processed_df.columns]
+        if missing:
+            return {"error": f"产品数据缺少必要的列: {', '.join(missing)}", "recommendations": []}
 
-        print(f"为用户 {user_id} 生成推荐...")
-        print(f"用户画像: 年龄{user_profile['age']}岁, 年收入{user_profile['annual_income']}万元, "
-              f"风险偏好{user_profile['risk_tolerance']}, 社保类型{user_profile['social_security_type']}")
+        user_profile = self.user_profiles[user_id]
 
-        # 获取所有产品或根据过滤条件筛选
-        if filter_criteria:
-            products_df = self._filter_products(filter_criteria)
-        else:
-            products_df = self.analyzer.processed_df.copy()
+        log.debug("为用户 %s 生成推荐: 年龄%s岁, 年收入%s万元, 风险偏好%s, 社保类型%s",
+                  user_id, user_profile['age'], user_profile['annual_income'],
+                  user_profile['risk_tolerance'], user_profile['social_security_type'])
+
+        view = self._get_scoring_view()
+
+        # 相同画像、过滤条件和数量的查询复用缓存的前N名选取结果
+        # 只缓存选取结果，推荐字典每次重新生成，调用方修改返回结果不会影响缓存
+        cache_key = self._recommendation_cache_key(user_profile, top_n, filter_criteria)
+        selection = self._cached_selection(cache_key)
+        if selection is None:
+            selection = self._select_top_products(user_profile, view, top_n, filter_criteria)
+            self._cache_selection(cache_key, selection)
+        top_df, scores, total_score, evaluated_count = selection
+
+        if output == 'dataframe':
+            frame = self._build_recommendation_frame(top_df, scores, total_score, user_profile)
+            return self._record_recommendations(user_id, user_profile, frame, evaluated_count)
+
+        top_recommendations = (self._build_recommendations(top_df, scores, total_score, user_profile)
+                               if evaluated_count else [])
+        result = self._record_recommendations(user_id, user_profile, top_recommendations, evaluated_count)
+        if "error" not in result:
+            log.info("推荐完成: 评估了%d个产品，推荐%d个", evaluated_count, len(top_recommendations))
+        return result
 
-        if products_df.empty:
+    def _record_recommendations(self, user_id: str, user_profile: Dict, top_recommendations,
+                                evaluated_count: int) -> Dict:
+        """记录推荐历史并构建返回结果，top_recommendations为推荐结果列表或DataFrame"""
+        if evaluated_count == 0:
             return {"error": "没有找到符合条件的产品", "recommendations": []}
 
-        # 计算每个产品的匹配分数
-        scored_products = []
-
-        for _, product in products_df.iterrows():
-            try:
-                scores = {}
-
-                # 计算各项分数
-                scores['age_score'] = self._calculate_age_match_score(
-                    user_profile['age'], product['min_age'], product['max_age']
-                )
-
-                scores['income_score'] = self._calculate_income_match_score(
-                    user_profile['annual_income'], product['min_premium'], product['payment_type']
-                )
-
-                scores['risk_score'] = self._calculate_risk_match_score(
-                    user_profile['risk_tolerance'], product['risk_level']
-                )
-
-                scores['retirement_score'] = self._calculate_retirement_match_score(
-                    user_profile.get('expected_retirement_age', 60),
-                    product['coverage_age'], product['coverage_years']
-                )
-
-                scores['ss_score'] = self._calculate_social_security_match_score(
-                    user_profile['social_security_type'],
-                    product['insurance_type'],
-                    product.get('feature_keywords', [])
-                )
-
-                scores['investment_score'] = self._calculate_investment_match_score(
-                    user_profile.get('investment_amount', user_profile['annual_income'] * 0.5),
-                    product['min_premium']
-                )
-
-                # 计算加权总分
-                total_score = 0
-                for key, weight in self.weights.items():
-                    score_key = key.replace('_match', '_score')
-                    if score_key in scores:
-                        total_score += scores[score_key] * weight
-
-                # 生成推荐理由
-                reasons = self._generate_recommendation_reasons(scores, product.to_dict(), user_profile)
-
-                # 构建推荐结果
-                recommendation = {
-                    'product_id': product['product_id'],
-                    'product_name': product['product_name'],
-                    'insurance_company': product['insurance_company'],
-                    'match_score': round(total_score * 100, 1),  # 转换为百分制
-                    'age_range': product['age_range_str'],
-                    'insurance_type': product['insurance_type'],
-                    'payment_type': product['payment_type'],
-                    'min_premium': product['min_premium_str'],
-                    'risk_level': product['risk_level'],
-                    'coverage': product['coverage_str'],
-                    'recommendation_reasons': reasons,
-                    'detailed_scores': {k: round(v, 3) for k, v in scores.items()},
-                    'product_details': product.to_dict()
-                }
-
-                scored_products.append(recommendation)
-
-            except Exception as e:
-                print(f"计算产品 {product.get('product_name', '未知')} 分数时出错: {e}")
-                continue
-
-        # 按匹配分数排序
-        scored_products.sort(key=lambda x: x['match_score'], reverse=True)
-
-        # 获取前N个推荐
-        top_recommendations = scored_products[:top_n]
-
-        # 记录推荐历史
+        # 记录推荐历史（历史记录与返回结果使用同一时间）
+        # 历史中不保存完整的产品数据，需要时用analyzer.get_product_details(product_id)获取
+        if isinstance(top_recommendations, pd.DataFrame):
+            history_recommendations = top_recommendations.to_dict('records')
+        else:
+            top_recommendations = list(top_recommendations)
+            history_recommendations = [{k: v for k, v in rec.items() if k != 'product_details'}
+                                       for rec in top_recommendations]
+        now = datetime.now()
         recommendation_record = {
-            'timestamp': datetime.now().isoformat(),
+            'timestamp': now.isoformat(),
             'user_profile': user_profile,
-            'recommendations': top_recommendations,
-            'total_products_evaluated': len(scored_products)
+            'recommendations': history_recommendations,
+            'total_products_evaluated': evaluated_count
         }
 
         self.recommendation_history[user_id].append(recommendation_record)
@@ -467,80 +1079,150 @@ class PensionProductRecommender:
             "user_income": user_profile['annual_income'],
             "user_risk_tolerance": user_profile['risk_tolerance'],
             "user_social_security_type": user_profile['social_security_type'],
-            "total_products_evaluated": len(scored_products),
+            "total_products_evaluated": evaluated_count,
             "recommendation_count": len(top_recommendations),
             "recommendations": top_recommendations,
-            "recommendation_time": datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            "recommendation_time": now.strftime('%Y-%m-%d %H:%M:%S')
         }
-
-        print(f"推荐完成: 评估了{len(scored_products)}个产品，推荐{len(top_recommendations)}个")
         return result
 
+    def get_recommendations_batch(self, user_ids: List[str], top_n: int = 5,
+                                  filter_criteria: Dict = None) -> Dict[str, Dict]:
+        """
+        批量获取推荐产品，所有用户对所有产品的分数在一次矩阵运算中算出
+        Args:
+            user_ids: 用户ID列表
+            top_n: 每个用户返回前N个推荐
+            filter_criteria: 过滤条件，对所有用户相同
+
+        Returns:
+            用户ID到推荐结果字典的映射，每个结果与get_recommendations的返回值格式相同
+        """
+        results = {}
+        user_ids = list(dict.fromkeys(user_ids))  # 去重并保持顺序
+        for user_id in user_ids:
+            if user_id not in self.user_profiles:
+                results[user_id] = {"error": "用户不存在", "recommendations": []}
+        valid_ids = [user_id for user_id in user_ids if user_id not in results]
+        if not valid_ids:
+            return results
+
+        if self.analyzer.processed_df is None:
+            results.update({user_id: {"error": "数据未处理", "recommendations": []} for user_id in valid_ids})
+            return results
+
+        missing = [col for col in _REQUIRED_COLUMNS if col not in self.analyzer.processed_df.columns]
+        if missing:
+            error = f"产品数据缺少必要的列: {', '.join(missing)}"
+            results.update({user_id: {"error": error, "recommendations": []} for user_id in valid_ids})
+            return results
+
+        log.debug("为%d个用户批量生成推荐", len(valid_ids))
+
+        view = self._get_scoring_view()
+        products_df = self.analyzer.processed_df
+        if filter_criteria:
+            mask = self._filter_mask(filter_criteria)
+            products_df = products_df[mask]
+            view = {key: values[mask] for key, values in view.items()}
+
+        profiles = [self.user_profiles[user_id] for user_id in valid_ids]
+        if products_df.empty:
+            scores = total_score = rounded = None
+        else:
+            scores = self._score_matrix(self._user_arrays(profiles), view)
+            total_score = self._weighted_total(scores)
+            rounded = np.round(total_score * 100, 1)
+
+        # 每行单独取前N个，值相同时的顺序与get_recommendations一致
+        for row, (user_id, user_profile) in enumerate(zip(valid_ids, profiles)):
+            top_recommendations = []
+            if scores is not None:
+                order = _top_n_order(rounded[row], top_n)
+                top_recommendations = self._build_recommendations(
+                    products_df.iloc[order], {k: v[row, order] for k, v in scores.items()}, total_score[row, order],
+                    user_profile)
+            results[user_id] = self._record_recommendations(user_id, user_profile, top_recommendations,
+                                                            len(products_df))
+
+        return {user_id: results[user_id] for user_id in user_ids}
+
     def _filter_products(self, criteria: Dict) -> pd.DataFrame:
         """根据条件过滤产品"""
         if self.analyzer.processed_df is None:
             return pd.DataFrame()
 
-        df = self.analyzer.processed_df.copy()
+        df = self.analyzer.processed_df
+        return df[self._filter_mask(criteria)]
 
-        # 保险类型过滤
-        if 'insurance_type' in criteria:
-            df = df[df['insurance_type'] == criteria['insurance_type']]
+    def _filter_mask(self, criteria: Dict) -> np.ndarray:
+        """根据条件生成processed_df的行布尔掩码"""
+        df = self.analyzer.processed_df
 
-        # 风险等级过滤
-        if 'risk_level' in criteria:
-            df = df[df['risk_level'] == criteria['risk_level']]
+        # 所有条件合并为一个布尔掩码，只索引一次
+        mask = np.ones(len(df), dtype=bool)
 
-        # 缴费方式过滤
-        if 'payment_type' in criteria:
-            df = df[df['payment_type'] == criteria['payment_type']]
-
-        # 保险公司过滤
-        if 'insurance_company' in criteria:
-            df = df[df['insurance_company'] == criteria['insurance_company']]
+        # 保险类型、风险等级、缴费方式、保险公司过滤
+        for column in ('insurance_type', 'risk_level', 'payment_type', 'insurance_company'):
+            if column in criteria:
+                mask &= (df[column] == criteria[column]).to_numpy()
 
         # 年龄过滤
         if 'min_age' in criteria:
-            df = df[df['min_age'] <= criteria['min_age']]
+            mask &= df['min_age'].to_numpy() <= criteria['min_age']
         if 'max_age' in criteria:
-            df = df[df['max_age'] >= criteria['max_age']]
+            mask &= df['max_age'].to_numpy() >= criteria['max_age']
 
         # 最低保费过滤
         if 'max_premium' in criteria:
-            df = df[df['min_premium'] <= criteria['max_premium']]
+            mask &= df['min_premium'].to_numpy() <= criteria['max_premium']
 
-        return df
+        return mask
 
     def get_recommendation_history(self, user_id: str) -> List[Dict]:
         """获取用户的推荐历史"""
-        return self.recommendation_history.get(user_id, [])
+        return list(self.recommendation_history.get(user_id, ()))
 
     def clear_user_history(self, user_id: str):
         """清除用户的推荐历史"""
         if user_id in self.recommendation_history:
-            self.recommendation_history[user_id] = []
+            self.recommendation_history[user_id] = self._new_history()
 
     def save_recommendation_history(self, filepath: str = 'recommendation_history.json'):
         """保存推荐历史到文件"""
         try:
-            with open(filepath, 'w', encoding='utf-8') as f:
-                json.dump(self.recommendation_history, f, ensure_ascii=False, indent=2)
-            print(f"推荐历史已保存到: {filepath}")
+            history = {user_id: list(records) for user_id, records in self.recommendation_history.items()}
+
+            # 不缩进输出；安装了orjson时用它序列化（NaN写为null）
+            if orjson is not None:
+                with open(filepath, 'wb') as f:
+                    f.write(orjson.dumps(history, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY))
+            else:
+                with open(filepath, 'w', encoding='utf-8') as f:
+                    json.dump(history, f, ensure_ascii=False)
+            log.info("推荐历史已保存到: %s", filepath)
             return True
         except Exception as e:
-            print(f"保存推荐历史失败: {e}")
+            log.error("保存推荐历史失败: %s", e)
             return False
 
     def load_recommendation_history(self, filepath: str = 'recommendation_history.json'):
         """从文件加载推荐历史"""
         if os.path.exists(filepath):
             try:
-                with open(filepath, 'r', encoding='utf-8') as f:
-                    self.recommendation_history = json.load(f)
-                print(f"推荐历史已从 {filepath} 加载")
+                with open(filepath, 'rb') as f:
+                    data = f.read()
+                try:
+                    history = orjson.loads(data) if orjson is not None else json.loads(data)
+                except ValueError:
+                    # 旧版本用json保存的文件可能含有NaN，orjson无法解析
+                    history = json.loads(data)
+                self.recommendation_history = {user_id: self._new_history(records)
+                                               for user_id, records in history.items()}
+                log.info("推荐历史已从 %s 加载", filepath)
                 return True
             except Exception as e:
-                print(f"加载推荐历史失败: {e}")
+                log.error("加载推荐历史失败: %s", e)
                 return False
         return False
 
@@ -711,6 +1393,32 @@ def test_recommender():
     for item in advice['general_advice']:
         print(f"  - {item}")
 
+    # 测试融合评分内核（未安装numba时按纯Python执行），结果应与NumPy路径一致
+    print("\n测试融合评分内核...")
+    view = recommender._get_scoring_view()
+    # 部分产品保费置为缺失，检查NaN的处理（应得到有限分数）
+    nan_view = dict(view, min_premium=np.where(np.arange(len(view['min_premium'])) % 5 == 0,
+                                               np.nan, view['min_premium']))
+    consistent = True
+    for scoring_view in (view, nan_view):
+        for ss_type in ('无', '城乡居民', '城镇职工', '其他'):
+            for income in (0.0, 20.0):
+                profile = dict(recommender.user_profiles[user_id], social_security_type=ss_type,
+                               annual_income=income)
+                expected = recommender._weighted_total(
+                    recommender._score_products_vectorized(profile, scoring_view))
+                fused = recommender._fused_total_score(profile, scoring_view)
+                consistent = (consistent and np.isfinite(expected).all()
+                              and np.allclose(fused, expected, rtol=0, atol=1e-12))
+    print(f"融合内核与NumPy路径结果一致: {consistent}")
+
+    # 测试含NaN分数时的前N名选取，NaN应排在最后且不减少入选数量
+    print("\n测试前N名选取...")
+    values = np.array([50, np.nan, 70, 60, np.nan, 40])
+    expected = [2, 3, 0, 5, 1, 4]
+    correct = all(_top_n_order(values, top_n).tolist() == expected[:top_n] for top_n in range(len(values) + 2))
+    print(f"含NaN分数的前N名选取正确: {correct}")
+
     print("\n推荐系统测试完成!")
 
 
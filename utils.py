@@ -4,13 +4,104 @@ utils.py - 工具函数模块
 """
 
 import re
-import qingli
+import json
 import pandas as pd
 import numpy as np
-from typing import Optional, Tuple, Dict, List, Any
+from typing import Optional, Tuple, Dict, List, Any, Iterable, Iterator
 from datetime import datetime, date
 import hashlib
+import itertools
+import mmap
 import os
+from functools import lru_cache
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# 表示字典中不存在的键
+_MISSING = object()
+
+# human_readable_size使用的单位，下标为字节数二进制位数减1后除以10
+_SIZE_UNITS = (
+    (1, 'B'),
+    (1024, 'KB'),
+    (1024 * 1024, 'MB'),
+    (1024 * 1024 * 1024, 'GB')
+)
+
+# 超过此大小的文件计算哈希时映射到内存
+_MMAP_HASH_THRESHOLD = 64 * 1024 * 1024
+
+# 邮箱格式，按@拆分为用户名和域名两部分分别匹配
+_EMAIL_LOCAL_RE = re.compile(r'[a-zA-Z0-9._%+-]+\Z')
+_EMAIL_DOMAIN_RE = re.compile(r'[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$')
+
+# 连续空白
+_WS_RE = re.compile(r'\s+')
+
+# 中文标点到英文标点的替换表
+_PUNCT_TABLE = str.maketrans({
+    '，': ',',
+    '。': '.',
+    '；': ';',
+    '：': ':',
+    '！': '!',
+    '？': '?',
+    '（': '(',
+    '）': ')',
+    '【': '[',
+    '】': ']',
+    '「': '<',
+    '」': '>'
+})
+
+# normalize_text需要处理的内容：空格以外的空白、连续空格、中文标点
+_NORMALIZE_PROBE_RE = re.compile(r'[^\S ]| {2}|[，。；：！？（）【】「」]')
+
+# 单个汉字或一个英文单词
+_WORD_RE = re.compile(r'[\u4e00-\u9fff]|\b[a-zA-Z]+\b')
+
+# 汉字
+_CJK_RE = re.compile(r'[\u4e00-\u9fff]')
+
+# 连续数字
+_NUM_RE = re.compile(r'\d+')
+
+# 年龄范围的常见写法，按优先级排列
+_AGE_PATTERNS = [re.compile(pattern) for pattern in (
+    r'(\d+)\s*[岁周岁]\s*至\s*(\d+)\s*[岁周岁]',
+    r'(\d+)\s*-\s*(\d+)\s*[岁周岁]',
+    r'(\d+)\s*到\s*(\d+)\s*[岁周岁]',
+    r'(\d+)\s*~\s*(\d+)\s*[岁周岁]',
+    r'年龄\s*(\d+)\s*[岁周岁]',
+    r'(\d+)\s*[岁周岁]'
+)]
+
+# 所有年龄写法合并为一个正则，分支名a0-a5对应_AGE_PATTERNS中的下标
+_AGE_RE = re.compile('|'.join(f'(?P<a{i}>{pattern.pattern})' for i, pattern in enumerate(_AGE_PATTERNS)))
+
+# parse_date默认尝试的日期格式，按顺序尝试
+_DATE_FORMATS = (
+    '%Y-%m-%d',
+    '%Y/%m/%d',
+    '%Y年%m月%d日',
+    '%d/%m/%Y',
+    '%m/%d/%Y'
+)
+
+# 与_DATE_FORMATS一一对应的正则分支，年月日的写法与strptime接受的相同
+_DATE_YEAR = r'\d\d\d\d'
+_DATE_MONTH = r'1[0-2]|0[1-9]|[1-9]'
+_DATE_DAY = r'3[01]|[12]\d|0[1-9]|[1-9]| [1-9]'
+_DATE_RE = re.compile('|'.join(f'(?P<f{i}>{branch})' for i, branch in enumerate([
+    f'(?P<y0>{_DATE_YEAR})-(?P<m0>{_DATE_MONTH})-(?P<d0>{_DATE_DAY})',
+    f'(?P<y1>{_DATE_YEAR})/(?P<m1>{_DATE_MONTH})/(?P<d1>{_DATE_DAY})',
+    f'(?P<y2>{_DATE_YEAR})年(?P<m2>{_DATE_MONTH})月(?P<d2>{_DATE_DAY})日',
+    f'(?P<d3>{_DATE_DAY})/(?P<m3>{_DATE_MONTH})/(?P<y3>{_DATE_YEAR})',
+    f'(?P<m4>{_DATE_MONTH})/(?P<d4>{_DATE_DAY})/(?P<y4>{_DATE_YEAR})',
+])))
 
 
 def extract_numbers(text: str) -> List[int]:
@@ -24,8 +115,8 @@ def extract_numbers(text: str) -> List[int]:
     if not text or not isinstance(text, str):
         return []
 
-    numbers = re.findall(r'\d+', text)
-    return [int(num) for num in numbers if num.isdigit()]
+    # \d+匹配到的都是数字，无需再用isdigit()检查
+    return list(map(int, _NUM_RE.findall(text)))
 
 
 def extract_age(text: str) -> Tuple[Optional[int], Optional[int]]:
@@ -41,18 +132,17 @@ def extract_age(text: str) -> Tuple[Optional[int], Optional[int]]:
 
     text = str(text).lower()
 
-    # 常见模式
-    patterns = [
-        r'(\d+)\s*[岁周岁]\s*至\s*(\d+)\s*[岁周岁]',
-        r'(\d+)\s*-\s*(\d+)\s*[岁周岁]',
-        r'(\d+)\s*到\s*(\d+)\s*[岁周岁]',
-        r'(\d+)\s*~\s*(\d+)\s*[岁周岁]',
-        r'年龄\s*(\d+)\s*[岁周岁]',
-        r'(\d+)\s*[岁周岁]'
-    ]
-
-    for pattern in patterns:
-        match = re.search(pattern, text)
+    # 合并的正则只扫描一遍，找到任一写法最靠前的出现位置，没有则直接返回
+    first_match = _AGE_RE.search(text)
+    if not first_match:
+        return None, None
+
+    # 各写法仍按优先级依次尝试，但都不会在该位置之前出现，
+    # 优先级更高的写法在该位置也未匹配，因此从该位置（或其后一位）开始查找即可
+    start = first_match.start()
+    first = int(first_match.lastgroup[1:])
+    for i, pattern in enumerate(_AGE_PATTERNS):
+        match = pattern.search(text, start + 1 if i < first else start)
         if match:
             groups = match.groups()
             if len(groups) == 2:
@@ -95,6 +185,27 @@ def format_currency(amount: float, symbol: str = '¥') -> str:
         return "N/A"
 
 
+def format_currency_array(amounts, symbol: str = '¥') -> np.ndarray:
+    """
+    批量格式化货币金额，格式与format_currency相同
+    Args:
+        amounts: 金额数组、列表或Series，数字字符串按数值处理
+        symbol: 货币符号
+    Returns:
+        格式化后的字符串数组，空值(None/NaN)和无法转换为数字的值为"N/A"
+    """
+    values = pd.to_numeric(np.asarray(amounts, dtype=object).ravel(), errors='coerce').astype(float)
+
+    # 单位和换算按整个数组一次算出，逐个元素只做格式化（%格式不支持千分位，不能用np.char.mod）
+    big = values >= 10000
+    scaled = np.where(big, values / 10000, values).tolist()
+    units = np.where(big, '万元', '元').tolist()
+
+    result = np.array([f"{symbol}{value:,.2f}{unit}" for value, unit in zip(scaled, units)], dtype=object)
+    result[np.isnan(values)] = "N/A"
+    return result
+
+
 def calculate_age(birth_date: date) -> int:
     """
     计算年龄
@@ -121,8 +232,15 @@ def validate_email(email: str) -> bool:
     Returns:
         是否有效
     """
-    pattern = r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$'
-    return bool(re.match(pattern, email))
+    # 先用字符串操作排除明显无效的输入，再用正则检查
+    if not email or '@' not in email:
+        return False
+
+    local, _, domain = email.rpartition('@')
+    if not local or '.' not in domain:
+        return False
+
+    return bool(_EMAIL_LOCAL_RE.match(local) and _EMAIL_DOMAIN_RE.match(domain))
 
 
 def validate_phone(phone: str) -> bool:
@@ -133,8 +251,8 @@ def validate_phone(phone: str) -> bool:
     Returns:
         是否有效
     """
-    pattern = r'^1[3-9]\d{9}$'
-    return bool(re.match(pattern, phone))
+    # 即1[3-9]开头的11位数字，直接用字符串方法判断，不经过正则引擎
+    return len(phone) == 11 and phone[0] == '1' and phone[1] in '3456789' and phone[2:].isdecimal()
 
 
 def safe_int(value: Any, default: int = 0) -> int:
@@ -207,14 +325,20 @@ def flatten_dict(d: Dict, parent_key: str = '', sep: str = '.') -> Dict:
     Returns:
         扁平化字典
     """
-    items = []
-    for k, v in d.items():
-        new_key = f"{parent_key}{sep}{k}" if parent_key else k
-        if isinstance(v, dict):
-            items.extend(flatten_dict(v, new_key, sep=sep).items())
+    # 用显式栈代替递归，栈中保存每层的键前缀和尚未遍历完的迭代器，结果顺序与递归展开相同
+    result = {}
+    stack = [(parent_key, iter(d.items()))]
+    while stack:
+        prefix, items = stack[-1]
+        for k, v in items:
+            new_key = f"{prefix}{sep}{k}" if prefix else k
+            if isinstance(v, dict):
+                stack.append((new_key, iter(v.items())))
+                break
+            result[new_key] = v
         else:
-            items.append((new_key, v))
-    return dict(items)
+            stack.pop()
+    return result
 
 
 def chunk_list(lst: List, chunk_size: int) -> List[List]:
@@ -229,6 +353,26 @@ def chunk_list(lst: List, chunk_size: int) -> List[List]:
     return [lst[i:i + chunk_size] for i in range(0, len(lst), chunk_size)]
 
 
+def iter_chunks(iterable: Iterable, chunk_size: int) -> Iterator[List]:
+    """
+    逐块产出元素，不预先切出全部分块，适合只遍历一次的大列表或生成器
+    Args:
+        iterable: 输入序列或迭代器
+        chunk_size: 块大小
+    Returns:
+        每次产出一个不超过chunk_size个元素的列表
+    """
+    if chunk_size <= 0:
+        raise ValueError("块大小必须大于0")
+
+    it = iter(iterable)
+    while True:
+        batch = list(itertools.islice(it, chunk_size))
+        if not batch:
+            return
+        yield batch
+
+
 def get_file_hash(filepath: str, algorithm: str = 'md5') -> str:
     """
     计算文件哈希值
@@ -242,8 +386,16 @@ def get_file_hash(filepath: str, algorithm: str = 'md5') -> str:
 
     try:
         with open(filepath, 'rb') as f:
-            for chunk in iter(lambda: f.read(4096), b''):
-                hash_func.update(chunk)
+            if os.fstat(f.fileno()).st_size > _MMAP_HASH_THRESHOLD:
+                # 大文件映射到内存，一次交给hashlib处理
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    hash_func.update(mm)
+            elif hasattr(hashlib, 'file_digest'):
+                # Python 3.11+ 由hashlib.file_digest直接读取，否则按1MB分块读取
+                hashlib.file_digest(f, lambda: hash_func)
+            else:
+                for chunk in iter(lambda: f.read(1 << 20), b''):
+                    hash_func.update(chunk)
         return hash_func.hexdigest()
     except Exception:
         return ''
@@ -274,14 +426,23 @@ def parse_date(date_str: str, formats: List[str] = None) -> Optional[date]:
     Returns:
         日期对象
     """
-    if formats is None:
-        formats = [
-            '%Y-%m-%d',
-            '%Y/%m/%d',
-            '%Y年%m月%d日',
-            '%d/%m/%Y',
-            '%m/%d/%Y'
-        ]
+    formats = _DATE_FORMATS if formats is None else tuple(formats)
+    return _parse_date_cached(date_str, formats)
+
+
+@lru_cache(maxsize=8192)
+def _parse_date_cached(date_str: str, formats: Tuple[str, ...]) -> Optional[date]:
+    """按格式依次尝试解析日期，相同的字符串只解析一次"""
+    if formats == _DATE_FORMATS:
+        # 默认格式用一个正则匹配，按命中的分支取出年月日
+        match = _DATE_RE.fullmatch(date_str)
+        if not match:
+            return None
+        i = match.lastgroup[1:]
+        try:
+            return date(int(match.group('y' + i)), int(match.group('m' + i)), int(match.group('d' + i)))
+        except ValueError:
+            pass  # 日期不存在（如2月30日）时交给strptime逐个格式尝试
 
     for fmt in formats:
         try:
@@ -338,24 +499,15 @@ def normalize_text(text: str) -> str:
     # 去除首尾空格
     text = text.strip()
 
-    # 替换多个空格为单个空格
-    text = re.sub(r'\s+', ' ', text)
+    # 大多数文本无需处理，先扫描一遍，没有需要替换的内容时直接返回
+    if not _NORMALIZE_PROBE_RE.search(text):
+        return text
 
-    # 替换中文标点
-    text = text.replace('，', ',')
-    text = text.replace('。', '.')
-    text = text.replace('；', ';')
-    text = text.replace('：', ':')
-    text = text.replace('！', '!')
-    text = text.replace('？', '?')
-    text = text.replace('（', '(')
-    text = text.replace('）', ')')
-    text = text.replace('【', '[')
-    text = text.replace('】', ']')
-    text = text.replace('「', '<')
-    text = text.replace('」', '>')
+    # 替换多个空格为单个空格
+    text = _WS_RE.sub(' ', text)
 
-    return text
+    # 替换中文标点（一次遍历完成全部替换）
+    return text.translate(_PUNCT_TABLE)
 
 
 def generate_id(prefix: str = 'ID', length: int = 8) -> str:
@@ -387,8 +539,18 @@ def save_json(data: Any, filepath: str, indent: int = 2) -> bool:
         是否成功
     """
     try:
-        with open(filepath, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=indent)
+        # orjson只支持不缩进和缩进2格，其他缩进仍用json（orjson会把NaN写为null）
+        if orjson is not None and indent in (None, 2):
+            option = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+            if indent:
+                option |= orjson.OPT_INDENT_2
+            content = orjson.dumps(data, option=option)
+        else:
+            content = json.dumps(data, ensure_ascii=False, indent=indent).encode('utf-8')
+
+        # 序列化成功后再写文件，失败时不会留下写了一半的文件
+        with open(filepath, 'wb') as f:
+            f.write(content)
         return True
     except Exception as e:
         print(f"保存JSON文件失败: {e}")
@@ -407,8 +569,14 @@ def load_json(filepath: str) -> Optional[Any]:
         return None
 
     try:
-        with open(filepath, 'r', encoding='utf-8') as f:
-            return json.load(f)
+        with open(filepath, 'rb') as f:
+            content = f.read()
+        if orjson is not None:
+            try:
+                return orjson.loads(content)
+            except ValueError:
+                pass  # 含有NaN等orjson不接受的内容时用json解析
+        return json.loads(content)
     except Exception as e:
         print(f"加载JSON文件失败: {e}")
         return None
@@ -452,7 +620,13 @@ def filter_dict(data: Dict, keys: List[str]) -> Dict:
     Returns:
         过滤后的字典
     """
-    return {k: data.get(k) for k in keys if k in data}
+    # 每个键只查找一次，结果按keys的顺序排列
+    result = {}
+    for k in keys:
+        value = data.get(k, _MISSING)
+        if value is not _MISSING:
+            result[k] = value
+    return result
 
 
 def merge_dicts(dict1: Dict, dict2: Dict) -> Dict:
@@ -464,6 +638,10 @@ def merge_dicts(dict1: Dict, dict2: Dict) -> Dict:
     Returns:
         合并后的字典
     """
+    # 两个都是字典时用|运算一次构建结果（Python 3.9+）
+    if isinstance(dict1, dict) and isinstance(dict2, dict):
+        return dict1 | dict2
+
     result = dict1.copy()
     result.update(dict2)
     return result
@@ -480,13 +658,14 @@ def get_nested_value(data: Dict, key_path: str, default: Any = None, sep: str =
     Returns:
         值
     """
-    keys = key_path.split(sep)
     current = data
 
-    for key in keys:
-        if isinstance(current, dict) and key in current:
-            current = current[key]
-        else:
+    # 每层只查找一次
+    for key in _split_key(key_path, sep):
+        if not isinstance(current, dict):
+            return default
+        current = current.get(key, _MISSING)
+        if current is _MISSING:
             return default
 
     return current
@@ -503,18 +682,25 @@ def set_nested_value(data: Dict, key_path: str, value: Any, sep: str = '.') -> D
     Returns:
         更新后的字典
     """
-    keys = key_path.split(sep)
+    keys = _split_key(key_path, sep)
     current = data
 
-    for i, key in enumerate(keys[:-1]):
-        if key not in current or not isinstance(current[key], dict):
-            current[key] = {}
-        current = current[key]
+    for key in keys[:-1]:
+        child = current.get(key)
+        if not isinstance(child, dict):
+            child = current[key] = {}
+        current = child
 
     current[keys[-1]] = value
     return data
 
 
+@lru_cache(maxsize=1024)
+def _split_key(key_path: str, sep: str) -> Tuple[str, ...]:
+    """拆分键路径，相同的路径只拆分一次"""
+    return tuple(key_path.split(sep))
+
+
 def remove_none_values(data: Dict) -> Dict:
     """
     移除字典中的None值
@@ -537,13 +723,8 @@ def count_words(text: str) -> int:
     if not text:
         return 0
 
-    # 中文单词（以字符为单位）
-    chinese_chars = re.findall(r'[\u4e00-\u9fff]', text)
-
-    # 英文单词
-    english_words = re.findall(r'\b[a-zA-Z]+\b', text)
-
-    return len(chinese_chars) + len(english_words)
+    # 中文以字符为单位，英文以单词为单位，一次遍历计数，不生成匹配列表
+    return sum(1 for _ in _WORD_RE.finditer(text))
 
 
 def is_chinese(text: str) -> bool:
@@ -557,10 +738,34 @@ def is_chinese(text: str) -> bool:
     if not text:
         return False
 
-    chinese_chars = re.findall(r'[\u4e00-\u9fff]', text)
+    chinese_chars = _CJK_RE.findall(text)
     return len(chinese_chars) / max(len(text), 1) > 0.5
 
 
+def count_words_series(texts: pd.Series) -> pd.Series:
+    """
+    批量统计一列文本的单词数，规则与count_words相同
+    Args:
+        texts: 文本列
+    Returns:
+        单词数列，空值和非文本计为0
+    """
+    return texts.str.count(_WORD_RE.pattern).fillna(0).astype(int)
+
+
+def is_chinese_series(texts: pd.Series) -> pd.Series:
+    """
+    批量判断一列文本是否主要为中文，规则与is_chinese相同
+    Args:
+        texts: 文本列
+    Returns:
+        布尔列，空值和非文本为False
+    """
+    chinese = texts.str.count(_CJK_RE.pattern)
+    total = texts.str.len().clip(lower=1)
+    return (chinese / total > 0.5).fillna(False).astype(bool)
+
+
 def get_file_extension(filename: str) -> str:
     """
     获取文件扩展名
@@ -612,12 +817,10 @@ def human_readable_size(size_bytes: int) -> str:
     """
     if size_bytes < 1024:
         return f"{size_bytes} B"
-    elif size_bytes < 1024 * 1024:
-        return f"{size_bytes / 1024:.2f} KB"
-    elif size_bytes < 1024 * 1024 * 1024:
-        return f"{size_bytes / (1024 * 1024):.2f} MB"
-    else:
-        return f"{size_bytes / (1024 * 1024 * 1024):.2f} GB"
+
+    # 按二进制位数直接查表确定单位，不再逐级比较
+    divisor, unit = _SIZE_UNITS[min((int(size_bytes).bit_length() - 1) // 10, len(_SIZE_UNITS) - 1)]
+    return f"{size_bytes / divisor:.2f} {unit}"
 
 
 # 测试函数